@@ -1,18 +1,29 @@
 import os
-from openai import OpenAI
+import math
+from llm_clients import get_client, call_with_backoff
+from transcription_cache import TranscriptionCache, audio_key
 import logging
 import time
-from pydub import AudioSegment
+import shutil
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import re
+import subprocess
 import tempfile
 
 class AudioTranscriberOpenAI:
-    def __init__(self, output_dir="cache/transcriptions", api_key=None, task_manager=None, provider='openai'):
+    def __init__(self, output_dir="cache/transcriptions", api_key=None, task_manager=None, provider='openai',
+                 max_workers=4, max_retries=4, split_on_silence=False, preprocess=True, trim_silence=False):
         """
         Initialise le transcripteur audio avec l'API OpenAI.
         
         Args:
             output_dir (str): Dossier pour les transcriptions
             api_key (str): Clé API OpenAI (optionnel, utilise la variable d'environnement par défaut)
+            max_workers (int): Nombre maximal de segments transcrits en parallèle
+            max_retries (int): Nouvelles tentatives par segment sur 429 / erreurs transitoires
+            split_on_silence (bool): Place les coupures dans des silences proches des limites de segment
+            preprocess (bool): Convertit l'audio en parole mono 16 kHz bas débit avant le découpage
+            trim_silence (bool): Avec preprocess, supprime aussi les longs silences
         """
         # Configurer le logger interne
         self.logger = logging.getLogger('transcriber')
@@ -38,10 +49,13 @@ class AudioTranscriberOpenAI:
             api_key_masked = "Non définie" if not api_key else f"...{api_key[-4:]}" if len(api_key) > 4 else "Définie"
             self.logger.info(f"API key: {api_key_masked}")
             
-            self.client = OpenAI(
+            # Client partagé (pool de connexions keep-alive) entre les transcriptions
+            self.client = get_client(
                 api_key=api_key,
+                provider=provider,
                 base_url="https://api.deepseek.com/v1" if provider == "deepseek" else None,
-                timeout=300.0  # Augmenter le timeout à 5 minutes
+                timeout=300.0,  # Augmenter le timeout à 5 minutes
+                max_retries=0  # Les retries sont gérés par segment, avec backoff
             )
             self.logger.info("Client OpenAI initialisé avec succès")
             
@@ -49,12 +63,30 @@ class AudioTranscriberOpenAI:
             self.logger.error(f"Erreur lors de l'initialisation du client OpenAI: {str(e)}")
             raise
         
-        # Créer le dossier de sortie
+        # Créer le dossier de sortie, qui contient aussi le cache des transcriptions
         os.makedirs(output_dir, exist_ok=True)
+        self.cache = TranscriptionCache(output_dir)
         self.logger.info(f"Dossier de sortie prêt: {output_dir}")
 
         self.MAX_FILE_SIZE = 25 * 1024 * 1024  # 25 MB en octets
-        self.SEGMENT_LENGTH = 10 * 60 * 1000    # 10 minutes en millisecondes
+        self.MAX_WORKERS = max(1, max_workers)
+        self.MAX_RETRIES = max_retries
+        self.SPLIT_ON_SILENCE = split_on_silence
+        self.SIZE_MARGIN = 0.9  # Les segments visent 90% de MAX_FILE_SIZE (débit variable)
+        self.SILENCE_WINDOW = 30.0  # Recherche d'un silence jusqu'à 30 s avant chaque limite
+        self.SILENCE_NOISE = "-35dB"
+        self.SILENCE_MIN_DURATION = 0.4  # En secondes
+        self.PREPROCESS = preprocess
+        self.TRIM_SILENCE = trim_silence
+        # Encodage parole : la reconnaissance travaille en 16 kHz mono ; MP3 s'encode plusieurs
+        # fois plus vite qu'Opus pour une taille équivalente (libopus/.ogg aussi accepté).
+        # À 24 kbps, environ 2 h d'audio tiennent dans un seul envoi sous MAX_FILE_SIZE
+        self.SPEECH_SAMPLE_RATE = 16000
+        self.SPEECH_CODEC = "libmp3lame"
+        self.SPEECH_BITRATE = "24k"
+        self.SPEECH_EXTENSION = ".mp3"
+        self.TRIM_SILENCE_MIN_DURATION = 1.0  # Silences plus longs raccourcis à TRIM_SILENCE_KEEP secondes
+        self.TRIM_SILENCE_KEEP = 0.3
 
     def update_status(self, task_id, status_data):
         if self.task_manager and task_id:
@@ -79,39 +111,153 @@ class AudioTranscriberOpenAI:
         self.logger.info(f"Fichier trop grand, découpage en segments: {mp3_path}")
         
         try:
-            audio = AudioSegment.from_mp3(mp3_path)
-            self.logger.info(f"Durée de l'audio: {len(audio) / 1000:.2f} secondes")
-            segments = []
-            
+            duration = self.get_duration(mp3_path)
+            self.logger.info(f"Durée de l'audio: {duration:.2f} secondes")
+
+            # Longueur de segment bornée par la taille max au débit moyen du fichier
+            segment_time = duration * self.MAX_FILE_SIZE * self.SIZE_MARGIN / file_size
+            cut_points = self.plan_cut_points(mp3_path, duration, segment_time)
+            self.logger.info(f"Découpage en {len(cut_points) + 1} segments d'environ {segment_time:.0f} secondes")
+
             # Créer un dossier temporaire pour les segments
             temp_dir = tempfile.mkdtemp()
             self.logger.info(f"Dossier temporaire pour les segments créé: {temp_dir}")
-            
-            # Découper l'audio en segments
-            segment_count = (len(audio) + self.SEGMENT_LENGTH - 1) // self.SEGMENT_LENGTH  # Arrondir vers le haut
-            self.logger.info(f"Découpage en {segment_count} segments de {self.SEGMENT_LENGTH/1000:.0f} secondes")
-            
-            for i, start in enumerate(range(0, len(audio), self.SEGMENT_LENGTH)):
-                segment = audio[start:start + self.SEGMENT_LENGTH]
-                segment_path = os.path.join(temp_dir, f"segment_{i}.mp3")
-                self.logger.info(f"Création du segment {i+1}/{segment_count}: {segment_path}")
-                
-                start_time = time.time()
-                segment.export(segment_path, format="mp3")
-                end_time = time.time()
-                
-                segment_size_mb = os.path.getsize(segment_path) / (1024 * 1024)
-                self.logger.info(f"Segment {i+1} créé en {end_time-start_time:.2f}s, taille: {segment_size_mb:.2f} MB")
-                
-                segments.append(segment_path)
-                
-            self.logger.info(f"Audio découpé en {len(segments)} segments")
+
+            # Copie du flux sans décodage ni ré-encodage : mémoire constante quelle que soit la durée
+            extension = os.path.splitext(mp3_path)[1] or ".mp3"
+            start_time = time.time()
+            subprocess.run([
+                "ffmpeg", "-v", "error", "-i", mp3_path,
+                "-map", "0:a", "-c", "copy",
+                "-f", "segment", "-segment_times", ",".join(f"{t:.3f}" for t in cut_points),
+                "-reset_timestamps", "1",
+                os.path.join(temp_dir, f"segment_%04d{extension}")
+            ], check=True, capture_output=True)
+
+            segments = sorted(os.path.join(temp_dir, name) for name in os.listdir(temp_dir))
+            for i, segment_path in enumerate(segments):
+                segment_size = os.path.getsize(segment_path)
+                self.logger.info(f"Segment {i+1}: {segment_size / (1024 * 1024):.2f} MB")
+                if segment_size > self.MAX_FILE_SIZE:
+                    self.logger.warning(f"Segment {i+1} au-dessus de la limite de l'API: {segment_path}")
+
+            self.logger.info(f"Audio découpé en {len(segments)} segments en {time.time() - start_time:.2f}s")
             return segments
             
+        except subprocess.CalledProcessError as e:
+            self.logger.error(f"Erreur ffmpeg lors du découpage audio: {e.stderr.decode(errors='replace')}")
+            raise
         except Exception as e:
             self.logger.error(f"Erreur lors du découpage audio: {str(e)}")
             raise
 
+    def estimate_segments(self, file_size, duration):
+        """Nombre de segments que split_audio produirait pour un fichier de cette taille et durée"""
+        if file_size <= self.MAX_FILE_SIZE:
+            return 1
+        segment_time = duration * self.MAX_FILE_SIZE * self.SIZE_MARGIN / file_size
+        return math.ceil(duration / segment_time)
+
+    def preprocess_audio(self, audio_path):
+        """
+        Réencode l'audio pour la transcription : mono, 16 kHz, bas débit, en
+        supprimant éventuellement les longs silences.
+        La conversion se fait en flux par ffmpeg, en mémoire constante.
+
+        Returns:
+            tuple: (chemin du fichier préparé, dans un dossier temporaire ; statistiques)
+        """
+        start_time = time.time()
+        original_size = os.path.getsize(audio_path)
+        original_duration = self.get_duration(audio_path)
+
+        temp_dir = tempfile.mkdtemp()
+        output_path = os.path.join(temp_dir, f"speech{self.SPEECH_EXTENSION}")
+        filters = []
+        if self.TRIM_SILENCE:
+            filters = ["-af", f"silenceremove=stop_periods=-1:stop_duration={self.TRIM_SILENCE_MIN_DURATION}"
+                              f":stop_threshold={self.SILENCE_NOISE}:stop_silence={self.TRIM_SILENCE_KEEP}"]
+        try:
+            subprocess.run([
+                "ffmpeg", "-v", "error", "-i", audio_path,
+                "-map", "0:a:0", "-vn", "-ac", "1", "-ar", str(self.SPEECH_SAMPLE_RATE), *filters,
+                "-c:a", self.SPEECH_CODEC, "-b:a", self.SPEECH_BITRATE,
+                output_path
+            ], check=True, capture_output=True)
+        except Exception:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            raise
+
+        size = os.path.getsize(output_path)
+        duration = self.get_duration(output_path) if self.TRIM_SILENCE else original_duration
+        segments_before = self.estimate_segments(original_size, original_duration)
+        segments_after = self.estimate_segments(size, duration)
+        stats = {
+            'original_bytes': original_size,
+            'preprocessed_bytes': size,
+            'bytes_saved': original_size - size,
+            'original_duration': round(original_duration, 1),
+            'preprocessed_duration': round(duration, 1),
+            'segments_before': segments_before,
+            'segments_after': segments_after,
+            'segments_avoided': segments_before - segments_after
+        }
+        self.logger.info(
+            f"Audio préparé en {time.time() - start_time:.2f}s: {original_size / (1024 * 1024):.1f} MB -> "
+            f"{size / (1024 * 1024):.1f} MB, {segments_before} -> {segments_after} segment(s)"
+        )
+        return output_path, stats
+
+    def get_duration(self, audio_path):
+        """Durée du fichier en secondes, lue dans les métadonnées du conteneur (ffprobe)"""
+        result = subprocess.run([
+            "ffprobe", "-v", "error", "-show_entries", "format=duration",
+            "-of", "default=noprint_wrappers=1:nokey=1", audio_path
+        ], check=True, capture_output=True, text=True)
+        return float(result.stdout.strip())
+
+    def detect_silences(self, audio_path):
+        """
+        Détecte les silences avec le filtre silencedetect de ffmpeg (décodage en flux, mémoire constante).
+
+        Returns:
+            list: Silences (début, fin) en secondes
+        """
+        result = subprocess.run([
+            "ffmpeg", "-v", "info", "-nostats", "-i", audio_path,
+            "-af", f"silencedetect=noise={self.SILENCE_NOISE}:d={self.SILENCE_MIN_DURATION}",
+            "-f", "null", "-"
+        ], check=True, capture_output=True, text=True)
+        starts = [float(v) for v in re.findall(r"silence_start: (-?[\d.]+)", result.stderr)]
+        ends = [float(v) for v in re.findall(r"silence_end: ([\d.]+)", result.stderr)]
+        return list(zip(starts, ends))
+
+    def plan_cut_points(self, audio_path, duration, segment_time):
+        """
+        Calcule les instants de coupure (en secondes) pour des segments d'au plus segment_time.
+
+        Avec SPLIT_ON_SILENCE, chaque coupure est placée au milieu du dernier silence
+        détecté dans les SILENCE_WINDOW secondes qui précèdent la limite, pour ne pas
+        couper un mot ; sans silence proche, la coupure reste à la limite.
+
+        Returns:
+            list: Instants de coupure croissants
+        """
+        silences = []
+        if self.SPLIT_ON_SILENCE:
+            silences = [(start + end) / 2 for start, end in self.detect_silences(audio_path)]
+            self.logger.info(f"{len(silences)} silences détectés")
+        window = min(self.SILENCE_WINDOW, segment_time / 2)
+
+        cut_points = []
+        previous = 0.0
+        while duration - previous > segment_time:
+            limit = previous + segment_time
+            candidates = [middle for middle in silences if limit - window <= middle <= limit]
+            previous = max(candidates) if candidates else limit
+            cut_points.append(previous)
+        return cut_points
+
     def transcribe(self, audio_file_path, task_id=None):
         try:
             if not os.path.exists(audio_file_path):
@@ -146,7 +292,34 @@ class AudioTranscriberOpenAI:
                 })
             raise e
 
-    def transcript_mp3(self, mp3_path: str, task_id=None, save_cache: bool = True) -> str:
+    def transcribe_segment(self, segment_path, index, total_segments):
+        """
+        Transcrit un segment, avec backoff et nouvelles tentatives sur ce seul segment.
+
+        Returns:
+            str: La transcription du segment
+        """
+        segment_start_time = time.time()
+        self.logger.info(f"Envoi du segment {index+1}/{total_segments} à l'API pour transcription")
+
+        def create():
+            # Fichier rouvert à chaque tentative : l'envoi précédent l'a consommé
+            with open(segment_path, "rb") as audio_file:
+                return self.client.audio.transcriptions.create(
+                    model="whisper-1",
+                    file=audio_file,
+                    response_format="text"
+                )
+
+        result = call_with_backoff(create, self.MAX_RETRIES, f"Transcription du segment {index+1}")
+
+        # Résumé du résultat
+        result_preview = result[:50] + "..." if len(result) > 50 else result
+        self.logger.info(f"Segment {index+1}/{total_segments} transcrit en {time.time() - segment_start_time:.2f}s: {result_preview}")
+        return result
+
+    def transcript_mp3(self, mp3_path: str, task_id=None, save_cache: bool = True, cache_keys=(),
+                       on_segment=None) -> str:
         """
         Transcrit un fichier MP3 en texte en utilisant l'API OpenAI.
         Gère automatiquement le découpage des fichiers longs.
@@ -155,6 +328,9 @@ class AudioTranscriberOpenAI:
             mp3_path (str): Chemin vers le fichier MP3
             task_id (str): ID de la tâche pour le suivi de progression
             save_cache (bool): Si True, sauvegarde la transcription dans le cache
+            cache_keys (iterable): Clés de cache supplémentaires (ex: ID du média source)
+            on_segment (callable): Optionnel, appelé avec le texte de chaque segment
+                dès qu'il est disponible, dans l'ordre de l'audio
             
         Returns:
             str: La transcription du fichier audio
@@ -167,66 +343,79 @@ class AudioTranscriberOpenAI:
             self.logger.error(f"Fichier audio non trouvé: {mp3_path}")
             raise FileNotFoundError(f"Le fichier audio {mp3_path} n'existe pas")
             
-        basename = os.path.splitext(os.path.basename(mp3_path))[0]
-        output_file = os.path.join(self.output_dir, f"{basename}.txt")
-
-        # Vérifier le cache
-        if os.path.exists(output_file):
-            self.logger.info(f"Utilisation de la transcription en cache: {output_file}")
-            with open(output_file, 'r', encoding='utf-8') as f:
-                return f.read()
+        # Vérifier le cache : par contenu de l'audio, et par ID du média source
+        keys = [audio_key(mp3_path), *cache_keys]
+        cached = self.cache.get(*keys)
+        if cached is not None:
+            self.logger.info(f"Utilisation de la transcription en cache pour: {mp3_path}")
+            if on_segment:
+                on_segment(cached)
+            return cached
 
+        preprocessed_path = None
         try:
+            # Réduction de l'audio à ce qui sert à la reconnaissance, avant le découpage
+            source_path = mp3_path
+            if self.PREPROCESS:
+                try:
+                    preprocessed_path, preprocess_stats = self.preprocess_audio(mp3_path)
+                    source_path = preprocessed_path
+                    self.update_status(task_id, {'preprocessing': preprocess_stats})
+                except Exception as e:
+                    stderr = getattr(e, 'stderr', None)
+                    detail = stderr.decode(errors='replace') if isinstance(stderr, bytes) else str(e)
+                    self.logger.warning(f"Préparation de l'audio impossible, fichier d'origine utilisé: {detail}")
+
             self.logger.info("Préparation des segments audio pour la transcription")
-            segments = self.split_audio(mp3_path)
-            full_transcript = []
+            segments = self.split_audio(source_path)
             total_segments = len(segments)
 
             self.logger.info(f"Début de la transcription de {total_segments} segment(s)")
 
-            for i, segment_path in enumerate(segments):
-                segment_start_time = time.time()
-                self.logger.info(f"Traitement du segment {i+1}/{total_segments}: {segment_path}")
-                
-                # Mise à jour du progrès de transcription
-                progress = ((i + 1) / total_segments) * 100
-                self.update_status(task_id, {
-                    'status': 'transcribing',
-                    'progress': progress,
-                    'current_segment': i + 1,
-                    'total_segments': total_segments
-                })
+            # Segments transcrits en parallèle, réassemblés dans l'ordre
+            full_transcript = [None] * total_segments
+            completed = 0
+            emitted = 0  # Segments déjà transmis à on_segment (préfixe contigu)
+            self.update_status(task_id, {
+                'status': 'transcribing',
+                'progress': 0,
+                'current_segment': 0,
+                'total_segments': total_segments
+            })
 
+            with ThreadPoolExecutor(max_workers=min(self.MAX_WORKERS, total_segments)) as executor:
+                futures = {
+                    executor.submit(self.transcribe_segment, segment_path, i, total_segments): i
+                    for i, segment_path in enumerate(segments)
+                }
                 try:
-                    with open(segment_path, "rb") as audio_file:
-                        self.logger.info(f"Envoi du segment {i+1} à l'API pour transcription")
-                        start_api_call = time.time()
-                        
-                        result = self.client.audio.transcriptions.create(
-                            model="whisper-1",
-                            file=audio_file,
-                            response_format="text"
-                        )
-                        
-                        api_duration = time.time() - start_api_call
-                        self.logger.info(f"API a répondu en {api_duration:.2f}s pour le segment {i+1}")
-                        
-                        # Résumé du résultat
-                        result_preview = result[:50] + "..." if len(result) > 50 else result
-                        self.logger.info(f"Résultat obtenu: {result_preview}")
-                        
-                    full_transcript.append(result)
-
-                    # Nettoyer le segment temporaire si ce n'est pas le fichier original
-                    if segment_path != mp3_path:
-                        os.remove(segment_path)
-                        self.logger.info(f"Segment temporaire supprimé: {segment_path}")
-                        
-                    segment_duration = time.time() - segment_start_time
-                    self.logger.info(f"Segment {i+1}/{total_segments} traité en {segment_duration:.2f}s")
-                    
+                    for future in as_completed(futures):
+                        i = futures[future]
+                        full_transcript[i] = future.result()
+
+                        # Nettoyer le segment temporaire si ce n'est pas le fichier découpé
+                        if segments[i] != source_path:
+                            os.remove(segments[i])
+                            self.logger.info(f"Segment temporaire supprimé: {segments[i]}")
+
+                        # Progression mise à jour depuis ce seul thread : nombre de segments
+                        # terminés, quel que soit l'ordre dans lequel ils se terminent
+                        completed += 1
+                        self.update_status(task_id, {
+                            'status': 'transcribing',
+                            'progress': completed / total_segments * 100,
+                            'current_segment': completed,
+                            'total_segments': total_segments
+                        })
+
+                        # Les segments sont transmis dans l'ordre dès que tous les précédents sont prêts
+                        while on_segment and emitted < total_segments and full_transcript[emitted] is not None:
+                            on_segment(full_transcript[emitted])
+                            emitted += 1
                 except Exception as e:
                     self.logger.error(f"Erreur pendant la transcription du segment {i+1}: {str(e)}")
+                    for pending in futures:
+                        pending.cancel()
                     raise
 
             # Assembler la transcription complète
@@ -234,9 +423,8 @@ class AudioTranscriberOpenAI:
             self.logger.info(f"Transcription complète générée: {len(transcript)} caractères")
 
             if save_cache:
-                self.logger.info(f"Sauvegarde de la transcription dans le cache: {output_file}")
-                with open(output_file, 'w', encoding='utf-8') as f:
-                    f.write(transcript)
+                self.logger.info(f"Sauvegarde de la transcription dans le cache: {keys}")
+                self.cache.put(transcript, *keys)
 
             self.update_status(task_id, {
                 'transcription_progress': 100
@@ -250,11 +438,13 @@ class AudioTranscriberOpenAI:
             self.logger.error(f"Erreur pendant la transcription: {str(e)}")
             raise
         finally:
-            # Nettoyer le dossier temporaire si utilisé
-            if 'segments' in locals() and segments[0] != mp3_path:
+            # Nettoyer le dossier temporaire si utilisé (avec les segments restants en cas d'erreur)
+            if preprocessed_path:
+                shutil.rmtree(os.path.dirname(preprocessed_path), ignore_errors=True)
+            if 'segments' in locals() and segments[0] != source_path:
                 try:
                     temp_dir = os.path.dirname(segments[0])
-                    os.rmdir(temp_dir)
+                    shutil.rmtree(temp_dir)
                     self.logger.info(f"Dossier temporaire nettoyé: {temp_dir}")
                 except Exception as e:
                     self.logger.error(f"Impossible de nettoyer le dossier temporaire: {str(e)}")
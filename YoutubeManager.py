@@ -1,145 +1,192 @@
 from yt_dlp import YoutubeDL
 import os
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
+import time
 import logging
+from transcription_cache import media_key
+from youtube_search import YoutubeSearch
 
 class YoutubeManager:
+    PROGRESS_MIN_INTERVAL = 0.5  # Intervalle minimal entre deux mises à jour de progression (en secondes)
+    # Pistes audio seules, dans un conteneur accepté par l'API de transcription
+    AUDIO_FORMAT = 'bestaudio[ext=m4a]/bestaudio[ext=webm]/bestaudio[ext=mp3]/bestaudio/best'
+
     def __init__(self, output_dir="cache/downloads", task_manager=None):
         self.logger = logging
         self.logger.info("Initializing YoutubeManager")
         self.output_dir = output_dir
         self.task_manager = task_manager
-        if not os.path.exists(self.output_dir):
-            os.makedirs(self.output_dir)
-            self.logger.info(f"Created output directory: {self.output_dir}")
+        self.searcher = YoutubeSearch()
 
     def update_status(self, task_id, status_data):
         if self.task_manager and task_id:
             self.task_manager.update_task_status(task_id, status_data)
 
     def search_videos(self, query, lang="US", limit=3):
-        limit = int(limit)
+        """Recherche des vidéos (yt-dlp, résultats en cache) ; retourne des tuples (titre, url)"""
         self.logger.info(f"Searching videos for query: '{query}', lang: {lang}, limit: {limit}")
-        chrome_options = Options()
-        chrome_options.add_argument("--headless")
-        chrome_options.add_argument("--incognito")
-        chrome_options.add_argument("--disable-extensions")
-        chrome_options.add_argument("--disable-cookies")
-        chrome_options.add_argument("--disable-plugins")
-        chrome_options.add_argument(f"--lang=en-{lang}")
-        chrome_options.add_argument(f"--accept-lang=en-{lang},en;q=0.9")
-        driver = webdriver.Chrome(options=chrome_options)
-        
         try:
-            url = f"https://www.youtube.com/results?search_query={query}&gl={lang}&hl=en"
-            self.logger.debug(f"Accessing URL: {url}")
-            driver.get(url)
-            # On enregistre la page pour le débogage
-            driver.save_screenshot("cache/youtube_search.png")
-            
-            wait = WebDriverWait(driver, 3)
-            videos = wait.until(EC.presence_of_all_elements_located(
-                (By.CSS_SELECTOR, "#video-title")
-            ))
-            
-            results = []
-            for video in videos[:limit]:
-                title = video.get_attribute('title')
-                url = video.get_attribute('href')
-                if title and url:
-                    results.append((title, url))
-            
-                    
+            results = self.searcher.search(query, lang, limit)
             self.logger.info(f"Found {len(results)} videos")
             return results
-            
         except Exception as e:
             self.logger.error(f"Error during video search: {str(e)}")
             raise
-        finally:
-            driver.quit()
-
-    def _sanitize_filename(self, filename):
-        """Nettoie le nom de fichier en remplaçant les caractères problématiques"""
-        # Remplacer les caractères spéciaux par des underscores
-        import re
-        filename = re.sub(r'[\\/*?:"<>|]', '_', filename)
-        # Supprimer les espaces multiples
-        filename = re.sub(r'\s+', ' ', filename)
-        return filename.strip()
-
-    def download_mp3(self, url: str, task_id=None) -> str:
-        try:
-            # Mise à jour initiale du statut
-            self.update_status(task_id, {
-                'status': 'downloading',
-                'progress': 0
-            })
-
-            # Configuration yt-dlp
-            with YoutubeDL({'quiet': True, 'no_warnings': True}) as ydl:
-                # Récupérer les informations
-                info = ydl.extract_info(url, download=False)
-                safe_title = self._sanitize_filename(info['title'])
-                
-                # Configuration pour le téléchargement
-                def progress_hook(d):
-                    if d['status'] == 'downloading':
-                        downloaded = d.get('downloaded_bytes', 0)
-                        total = d.get('total_bytes') or d.get('total_bytes_estimate', 0)
-                        if total > 0:
-                            progress = (downloaded / total) * 100
-                            self.update_status(task_id, {
-                                'status': 'downloading',
-                                'progress': progress
-                            })
-
-                ydl_opts = {
-                    'format': 'bestaudio/best',
-                    'postprocessors': [{
-                        'key': 'FFmpegExtractAudio',
-                        'preferredcodec': 'mp3',
-                        'preferredquality': '192',
-                    }],
-                    'outtmpl': os.path.join(self.output_dir, f'{safe_title}.%(ext)s'),
-                    'progress_hooks': [progress_hook],
-                }
-
-                # Téléchargement
-                with YoutubeDL(ydl_opts) as ydl2:
-                    ydl2.download([url])
-
-                mp3_path = os.path.join(self.output_dir, f"{safe_title}.mp3")
-                return mp3_path
 
+    def _progress_hook(self, task_id):
+        """
+        Hook de progression yt-dlp. yt-dlp l'appelle à chaque bloc reçu : on
+        n'écrit le statut qu'au plus toutes les PROGRESS_MIN_INTERVAL secondes.
+        """
+        last_sent = [0.0, -1]
+        def progress_hook(d):
+            if d['status'] == 'downloading':
+                downloaded = d.get('downloaded_bytes', 0)
+                total = d.get('total_bytes') or d.get('total_bytes_estimate', 0)
+                if total > 0:
+                    progress = round((downloaded / total) * 100, 1)
+                    now = time.monotonic()
+                    if now - last_sent[0] < self.PROGRESS_MIN_INTERVAL or progress == last_sent[1]:
+                        return
+                    last_sent[:] = [now, progress]
+                    self.update_status(task_id, {
+                        'status': 'downloading',
+                        'progress': progress
+                    })
+            elif d['status'] == 'finished':
+                self.update_status(task_id, {
+                    'status': 'downloading',
+                    'progress': 100
+                })
+        return progress_hook
+
+    def _download(self, url, task_id, options):
+        """Résout les métadonnées et télécharge en un seul appel à yt-dlp"""
+        self.update_status(task_id, {
+            'status': 'downloading',
+            'progress': 0
+        })
+        ydl_opts = {
+            'quiet': True,
+            'no_warnings': True,
+            'noplaylist': True,
+            'noprogress': True,
+            # Fichier nommé par ID : pas de collision entre titres identiques
+            'outtmpl': os.path.join(self.output_dir, '%(id)s.%(ext)s'),
+            'progress_hooks': [self._progress_hook(task_id)],
+            **options
+        }
+        # Dossier créé au premier téléchargement, pas à l'import
+        os.makedirs(self.output_dir, exist_ok=True)
+        with YoutubeDL(ydl_opts) as ydl:
+            info = ydl.extract_info(url, download=True)
+            downloads = info.get('requested_downloads') or [{}]
+            path = downloads[-1].get('filepath') or ydl.prepare_filename(info)
+        return path, info
+
+    def download_audio(self, url: str, task_id=None) -> dict:
+        """
+        Télécharge la piste audio seule, dans son conteneur d'origine (m4a, webm/opus),
+        sans ré-encodage. Ces formats sont acceptés tels quels par l'API de transcription.
+
+        Returns:
+            dict: {'path', 'video_id', 'title', 'url', 'ext', 'filesize'}
+        """
+        try:
+            start = time.time()
+            path, info = self._download(url, task_id, {'format': self.AUDIO_FORMAT})
+            size = os.path.getsize(path)
+            self.logger.info(f"Audio téléchargé en {time.time() - start:.1f}s: {path} ({size / (1024 * 1024):.1f} MB)")
+            return {
+                'path': path,
+                'video_id': info.get('id'),
+                'title': info.get('title'),
+                'url': info.get('webpage_url') or url,
+                'ext': os.path.splitext(path)[1].lstrip('.'),
+                'filesize': size
+            }
         except Exception as e:
-            self.logger.error(f"Error during MP3 download: {str(e)}")
+            self.logger.error(f"Error during audio download: {str(e)}")
             raise
 
-    def transcribe_video(self, url: str, task_id=None, transcriber=None) -> str:
+    def expand_playlist(self, url: str, limit=None) -> list:
         """
-        Télécharge la vidéo en MP3 et la transcrit.
+        Liste les vidéos d'une playlist ou d'une chaîne par extraction à plat
+        (une seule requête par page de la playlist, aucune page vidéo chargée).
+
+        Args:
+            url (str): URL de la playlist ou de la chaîne
+            limit (int): Nombre maximal de vidéos
+
+        Returns:
+            list: Dictionnaires {'video_id', 'title', 'url'}, dans l'ordre de la playlist
+        """
+        options = {'quiet': True, 'no_warnings': True, 'extract_flat': 'in_playlist'}
+        if limit:
+            options['playlistend'] = int(limit)
+        videos = []
+        seen = set()
+
+        def collect(entries, depth=0):
+            for entry in entries or []:
+                if limit and len(videos) >= int(limit):
+                    return
+                if entry.get('_type') == 'playlist' or entry.get('ie_key') == 'YoutubeTab':
+                    # Chaîne : les onglets (vidéos, shorts, lives) sont eux-mêmes des playlists
+                    if depth < 2:
+                        nested = entry if 'entries' in entry else ydl.extract_info(entry['url'], download=False)
+                        collect(nested.get('entries'), depth + 1)
+                    continue
+                video_id = entry.get('id')
+                if not video_id or video_id in seen:
+                    continue
+                seen.add(video_id)
+                videos.append({
+                    'video_id': video_id,
+                    'title': entry.get('title'),
+                    'url': entry.get('webpage_url') or f"https://www.youtube.com/watch?v={video_id}"
+                })
+
+        with YoutubeDL(options) as ydl:
+            info = ydl.extract_info(url, download=False)
+            collect(info.get('entries') if 'entries' in info else [info])
+        self.logger.info(f"{len(videos)} vidéos trouvées pour {url}")
+        return videos
+
+    def transcribe_video(self, url: str, task_id=None, transcriber=None, on_segment=None, on_download=None) -> str:
+        """
+        Télécharge l'audio de la vidéo et le transcrit.
+        Une vidéo déjà transcrite est servie depuis le cache, sans téléchargement.
+        on_segment, optionnel, reçoit le texte de chaque segment dès qu'il est transcrit.
+        on_download, optionnel, reçoit les métadonnées du téléchargement (voir
+        download_audio) avant la transcription ; il n'est pas appelé sur un cache hit.
         """
         try:
-            # Téléchargement
-            mp3_path = self.download_mp3(url, task_id)
-            if not mp3_path:
-                raise Exception("Échec du téléchargement MP3")
-
-            # Transcription
             if transcriber is None:
                 from AudioTranscriberOpenAI import AudioTranscriberOpenAI
                 transcriber = AudioTranscriberOpenAI()
-            
-            transcript = transcriber.transcript_mp3(mp3_path, task_id)
 
-            # Nettoyage
-            os.remove(mp3_path)
-            return transcript
+            # Cache par ID de la vidéo, avant tout téléchargement
+            video_key = media_key(url)
+            cached = transcriber.cache.get(video_key)
+            if cached is not None:
+                self.update_status(task_id, {'status': 'transcribing', 'progress': 100, 'cached': True})
+                if on_segment:
+                    on_segment(cached)
+                return cached
+
+            # Téléchargement de l'audio seul, sans conversion
+            audio = self.download_audio(url, task_id)
+            audio_path = audio['path']
+            if on_download:
+                on_download(audio)
+
+            # Transcription
+            try:
+                return transcriber.transcript_mp3(audio_path, task_id, cache_keys=[video_key] if video_key else (),
+                                                  on_segment=on_segment)
+            finally:
+                # Nettoyage
+                os.remove(audio_path)
 
         except Exception as e:
             self.logger.error(f"Erreur lors de la transcription: {str(e)}")
@@ -0,0 +1,121 @@
+import math
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def _normalize_vector(vector):
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+def context_key(model, chunk_ids):
+    """Clé du contexte : modèle + ensemble (non ordonné) des chunks récupérés"""
+    payload = "\0".join([model] + sorted(chunk_ids))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class AnswerCache:
+    def __init__(self, max_entries=512, threshold=0.97, ttl=7 * 24 * 3600):
+        """
+        Cache sémantique des réponses du chat.
+
+        Une réponse est réutilisée quand la question est proche d'une question déjà
+        posée (similarité cosinus des embeddings >= threshold) ET que la recherche a
+        retourné exactement le même ensemble de chunks, pour le même modèle.
+        Les entrées qui dépendent d'un chunk modifié ou supprimé sont invalidées.
+
+        Args:
+            max_entries (int): Nombre maximal de réponses gardées (LRU)
+            threshold (float): Similarité cosinus minimale entre les questions
+            ttl (float): Durée de validité d'une réponse en secondes
+        """
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # entry_id -> entrée
+        self.by_context = {}  # context_key -> set(entry_id)
+        self.by_chunk = {}  # chunk_id -> set(entry_id)
+        self.next_id = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def lookup(self, model, query_embedding, chunk_ids):
+        """Retourne la réponse en cache pour cette question et ce contexte, ou None"""
+        key = context_key(model, chunk_ids)
+        query = _normalize_vector(query_embedding)
+        with self.lock:
+            best_id, best_score = None, self.threshold
+            for entry_id in list(self.by_context.get(key, ())):
+                entry = self.entries[entry_id]
+                if time.time() - entry['created'] > self.ttl:
+                    self._remove(entry_id)
+                    continue
+                score = sum(a * b for a, b in zip(query, entry['embedding']))
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+            if best_id is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(best_id)
+            self.hits += 1
+            return self.entries[best_id]['answer']
+
+    def store(self, model, query_embedding, chunk_ids, answer):
+        key = context_key(model, chunk_ids)
+        with self.lock:
+            entry_id = self.next_id
+            self.next_id += 1
+            self.entries[entry_id] = {
+                'context_key': key,
+                'chunk_ids': list(chunk_ids),
+                'embedding': _normalize_vector(query_embedding),
+                'answer': answer,
+                'created': time.time()
+            }
+            self.by_context.setdefault(key, set()).add(entry_id)
+            for chunk_id in chunk_ids:
+                self.by_chunk.setdefault(chunk_id, set()).add(entry_id)
+            while len(self.entries) > self.max_entries:
+                self._remove(next(iter(self.entries)))
+
+    def invalidate_chunks(self, chunk_ids):
+        """Supprime les réponses construites à partir de l'un de ces chunks"""
+        with self.lock:
+            for chunk_id in chunk_ids:
+                for entry_id in list(self.by_chunk.get(chunk_id, ())):
+                    self._remove(entry_id)
+                    self.invalidations += 1
+
+    def clear(self):
+        with self.lock:
+            self.invalidations += len(self.entries)
+            self.entries.clear()
+            self.by_context.clear()
+            self.by_chunk.clear()
+
+    def _remove(self, entry_id):
+        entry = self.entries.pop(entry_id, None)
+        if entry is None:
+            return
+        self.by_context.get(entry['context_key'], set()).discard(entry_id)
+        if not self.by_context.get(entry['context_key']):
+            self.by_context.pop(entry['context_key'], None)
+        for chunk_id in entry['chunk_ids']:
+            entries = self.by_chunk.get(chunk_id)
+            if entries is not None:
+                entries.discard(entry_id)
+                if not entries:
+                    del self.by_chunk[chunk_id]
+
+    def stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations
+            }
@@ -1,33 +1,49 @@
 # app.py
 import os
-import shutil
 import uuid
+import hashlib
 import logging
 import json
+import threading
+import time
+from contextlib import contextmanager
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from flask import Flask, request, jsonify, session, Response, render_template
 from werkzeug.utils import secure_filename
 from langchain.text_splitter import TokenTextSplitter
 from langchain_chroma import Chroma
 from langchain_huggingface import HuggingFaceEmbeddings
-from openai_wrapper import OpenAIEmbeddingsWrapper
-import PyPDF2
-from openai import OpenAI
-from chromadb.config import Settings
-from youtube_routes import youtube_bp
+from openai_wrapper import OpenAIEmbeddingsWrapper, EmbeddingCache, CachedEmbeddings
+from document_loader import iter_document_pages
+from reformulation import ReformulationCache, retrieve_with_reformulation, STRATEGIES as REFORMULATION_STRATEGIES
+from answer_cache import AnswerCache
+from bm25_index import LexicalIndex, reciprocal_rank_fusion
+from prompt_builder import PromptBuilder
+from reranker import rerank, STRATEGIES as RERANK_STRATEGIES
+from ingestion import IngestionManifest, IngestionLock, IngestionJobQueue, file_hash, chunking_fingerprint, chunk_id_prefix, chunk_id, chunk_ids
+from llm_clients import get_client, registry as llm_client_registry
+from tasks import TaskManager
+from youtube_routes import youtube_bp, youtube_manager
 from routes_tiktok_insta import social_media_bp  # Nouvel import
 
 # Désactivation de la télémétrie Chroma
 os.environ['ANONYMIZED_TELEMETRY'] = 'False'
 
+# Lancé via python app.py, ce module est ré-exécuté sous le nom __mp_main__ par chaque
+# worker du pool d'extraction PDF (spawn) : ces workers ne démarrent rien
+POOL_WORKER = __name__ == '__mp_main__'
+
 # Configuration des logs plus détaillée
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(module)s - %(message)s',
-    handlers=[
-        logging.FileHandler('app.log'),
-        logging.StreamHandler()
-    ]
-)
+if not POOL_WORKER:
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(module)s - %(message)s',
+        handlers=[
+            logging.FileHandler('app.log'),
+            logging.StreamHandler()
+        ]
+    )
 
 app = Flask(__name__)
 app.secret_key = os.urandom(24)
@@ -37,129 +53,538 @@ app.secret_key = os.urandom(24)
 UPLOAD_FOLDER = 'cache/uploads'
 ALLOWED_EXTENSIONS = {'txt', 'pdf', 'docx'}
 PERSIST_DIRECTORY = 'cache/vector_store'
+MANIFEST_PATH = os.path.join(PERSIST_DIRECTORY, 'ingestion_manifest.json')
+INGESTION_LOCK_PATH = f"{PERSIST_DIRECTORY}.lock"  # À côté du store : le dossier vide signifie « pas de store »
 CHUNK_SIZE = 512  # En tokens
 OVERLAP_SIZE = 50  # En tokens
+INGESTION_BATCH_SIZE = 512  # Chunks embeddés et écrits dans Chroma par lot
+INGESTION_EMBED_AHEAD = 4  # Lots embeddés en parallèle pendant l'écriture des lots précédents
+INGESTION_VERSION = 3  # À incrémenter quand le découpage ou les métadonnées changent (force la ré-indexation)
 NB_RESULTS = 10
 EMBEDDING_PROVIDER = "openai"  # ou "local"
 EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2" if EMBEDDING_PROVIDER == "local" else "text-embedding-3-small"
 
+EMBEDDING_CACHE_SIZE = 2048  # Nombre d'embeddings de requêtes gardés en mémoire
+EMBEDDING_CACHE_TTL = 24 * 3600  # En secondes
+EMBEDDING_CACHE_PATH = 'cache/embedding_cache.sqlite3'  # None pour désactiver le cache disque
+REFORMULATION_STRATEGY = "parallel"  # Stratégie par défaut : off, always, cache ou parallel
+REFORMULATION_TIMEOUT = 1.5  # Mode parallel : attente maximale de la reformulation, en secondes
+HYBRID_SEARCH = True  # Fusionne la recherche vectorielle et la recherche lexicale BM25
+LEXICAL_INDEX_PATH = os.path.join(PERSIST_DIRECTORY, 'lexical_index.sqlite3')
+ANSWER_CACHE_SIZE = 512  # Nombre de réponses gardées dans le cache sémantique
+ANSWER_CACHE_THRESHOLD = 0.97  # Similarité cosinus minimale entre deux questions pour réutiliser une réponse
+RERANK_STRATEGY = "off"  # Reranking par défaut : off, mmr ou cross_encoder
+RERANK_CANDIDATES = 30  # Taille du pool de candidats reranké jusqu'à nb_results
+RERANK_MAX_CANDIDATES = 100
+RERANK_MMR_LAMBDA = 0.5  # 1 = pertinence seule, 0 = diversité seule
+RERANK_MODEL = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"  # Cross-encoder multilingue
+RERANK_BATCH_SIZE = 32
+PROMPT_MAX_OUTPUT_TOKENS = 4096  # Tokens réservés à la réponse dans la fenêtre du modèle
+PROMPT_CONTEXT_SHARE = 0.6  # Part maximale du budget d'entrée occupée par les chunks RAG
+EAGER_WARMUP = False  # Si True, pré-charge aussi le modèle/la connexion d'embedding au démarrage
+
 # Initialisation
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
+# Vector store et embeddings partagés par le process (voir get_vector_store)
+_store_lock = threading.RLock()
+_embeddings = None
+_vector_store = None
+_vector_store_generation = None
+_lexical_index = None
+_active_writers = 0
+_ingestion_lock = IngestionLock(INGESTION_LOCK_PATH)  # Une écriture à la fois par store, tous process confondus
+reformulation_cache = ReformulationCache()
+answer_cache = AnswerCache(max_entries=ANSWER_CACHE_SIZE, threshold=ANSWER_CACHE_THRESHOLD)
+query_embedding_cache = EmbeddingCache(
+    max_entries=EMBEDDING_CACHE_SIZE,
+    ttl=EMBEDDING_CACHE_TTL,
+    disk_path=EMBEDDING_CACHE_PATH
+)
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def read_text_file(file_path):
-    with open(file_path, 'r', encoding='utf-8') as file:
-        return file.read()
-
-def read_pdf_file(file_path):
-    text = ""
-    with open(file_path, 'rb') as file:
-        pdf_reader = PyPDF2.PdfReader(file)
-        for page in pdf_reader.pages:
-            text += page.extract_text()
-    return text
-
-def read_file(file_path):
-    extension = file_path.split('.')[-1].lower()
-    if extension == 'txt':
-        return read_text_file(file_path)
-    elif extension == 'pdf':
-        return read_pdf_file(file_path)
-    else:
-        raise ValueError(f"Type de fichier non supporté: {extension}")
-
 def get_embeddings():
-    """Retourne l'instance d'embedding appropriée selon le provider configuré"""
-    if EMBEDDING_PROVIDER == "openai":
-        return OpenAIEmbeddingsWrapper(model=EMBEDDING_MODEL)
-    else:
-        return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
-
-def process_documents():
+    """Retourne l'instance d'embedding (partagée par le process) selon le provider configuré"""
+    global _embeddings
+    if _embeddings is None:
+        with _store_lock:
+            if _embeddings is None:
+                if EMBEDDING_PROVIDER == "openai":
+                    embeddings = OpenAIEmbeddingsWrapper(model=EMBEDDING_MODEL)
+                else:
+                    embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+                _embeddings = CachedEmbeddings(embeddings, EMBEDDING_MODEL, query_embedding_cache)
+    return _embeddings
+
+def get_manifest():
+    return IngestionManifest(MANIFEST_PATH)
+
+def delete_document_chunks(vector_store, manifest, filename):
+    """
+    Supprime du vector store uniquement les chunks d'un document.
+
+    Utilise les IDs déterministes enregistrés dans le manifeste, ou à défaut
+    la métadonnée `source` (documents indexés avant le manifeste).
+
+    Returns:
+        int: Nombre de chunks supprimés (-1 si inconnu)
+    """
+    lexical_index = get_lexical_index()
+    entry = manifest.remove(filename)
+    if entry is not None:
+        ids = chunk_ids(entry)
+        if ids:
+            vector_store.delete(ids=ids)
+            lexical_index.delete(ids=ids)
+            answer_cache.invalidate_chunks(ids)
+        return len(ids)
+
+    vector_store._collection.delete(where={"source": filename})
+    lexical_index.delete(source=filename)
+    answer_cache.clear()
+    return -1
+
+def backfill_lexical_index(vector_store, entry):
+    """Indexe dans BM25 les chunks d'un document déjà présent dans Chroma mais absent de l'index lexical"""
+    ids = chunk_ids(entry)
+    lexical_index = get_lexical_index()
+    if not ids or lexical_index.contains(ids[0]):
+        return
+    for start in range(0, len(ids), INGESTION_BATCH_SIZE):
+        batch = vector_store.get(ids=ids[start:start + INGESTION_BATCH_SIZE], include=['documents', 'metadatas'])
+        lexical_index.add(batch['ids'], batch['documents'], batch['metadatas'])
+
+def iter_document_chunks(file_path, filename, text_splitter):
+    """
+    Découpe un document en flux, page par page (ou bloc par bloc pour le texte).
+
+    Yields:
+        tuple: (texte du chunk, métadonnées)
+    """
+    for page, text in iter_document_pages(file_path):
+        metadata = {"source": filename}
+        if page is not None:
+            metadata["page"] = page
+        for chunk in text_splitter.split_text(text):
+            yield chunk, dict(metadata)
+
+def write_chunks(vector_store, manifest, key, entry, chunks, on_flush=None):
+    """
+    Embedde et écrit un flux de chunks par lots de INGESTION_BATCH_SIZE.
+
+    Les embeddings de jusqu'à INGESTION_EMBED_AHEAD lots sont calculés en
+    parallèle pendant que les lots précédents sont écrits : un lot ne tient
+    qu'en une ou deux requêtes d'embedding, ce qui laisserait sinon les workers
+    de l'embedder inoccupés. Les écritures restent dans l'ordre, et la mémoire
+    dépend de la taille et du nombre de lots en vol, pas de celle du document.
+    Les IDs sont déterministes (préfixe de l'entrée + index du chunk) et
+    entry['chunk_count'] est enregistré dans le manifeste après chaque lot.
+
+    Returns:
+        int: Nombre total de chunks de l'entrée
+    """
+    lexical_index = get_lexical_index()
+    embeddings = vector_store.embeddings
+    pending = deque()
+
+    def write(batch, future):
+        start = entry['chunk_count']
+        texts = [text for text, _ in batch]
+        metadatas = [metadata for _, metadata in batch]
+        ids = [chunk_id(entry['id_prefix'], start + i) for i in range(len(batch))]
+        vector_store._collection.upsert(ids=ids, embeddings=future.result(), metadatas=metadatas, documents=texts)
+        lexical_index.add(ids, texts, metadatas)
+        answer_cache.invalidate_chunks(ids)
+        entry['chunk_count'] += len(batch)
+        manifest.set(key, entry)
+        if on_flush:
+            on_flush(entry['chunk_count'])
+
+    with ThreadPoolExecutor(max_workers=INGESTION_EMBED_AHEAD, thread_name_prefix='embed') as executor:
+        def submit(batch):
+            pending.append((batch, executor.submit(embeddings.embed_documents, [text for text, _ in batch])))
+            if len(pending) > INGESTION_EMBED_AHEAD:
+                write(*pending.popleft())
+
+        try:
+            batch = []
+            for chunk in chunks:
+                batch.append(chunk)
+                if len(batch) >= INGESTION_BATCH_SIZE:
+                    submit(batch)
+                    batch = []
+            if batch:
+                submit(batch)
+            while pending:
+                write(*pending.popleft())
+        finally:
+            for _, future in pending:
+                future.cancel()
+    return entry['chunk_count']
+
+def ingestion_fingerprint():
+    """Empreinte des paramètres de découpage et d'embedding courants"""
+    return chunking_fingerprint(
+        chunk_size=CHUNK_SIZE,
+        overlap_size=OVERLAP_SIZE,
+        embedding_model=EMBEDDING_MODEL,
+        version=INGESTION_VERSION
+    )
+
+def process_documents(progress_callback=None):
+    """
+    Indexe de façon incrémentale les fichiers de UPLOAD_FOLDER.
+
+    Seuls les fichiers nouveaux ou modifiés (hash du contenu ou paramètres de
+    découpage différents) sont découpés et embeddés. Les IDs de chunks sont
+    déterministes, une ré-exécution ne crée donc pas de doublons.
+    Le verrou d'ingestion est pris fichier par fichier : une suppression ou une
+    autre écriture attend au plus la fin du fichier en cours, pas tout le job.
+
+    Args:
+        progress_callback (callable): Optionnel, appelé avec (filename, stage, **info)
+            pour chaque étape (parsing, embedding, done, skipped, error)
+
+    Returns:
+        dict: Statistiques (fichiers/chunks ignorés, ajoutés, remplacés, supprimés),
+              ou False en cas d'erreur
+    """
+    stats = {
+        'files_skipped': 0, 'files_added': 0, 'files_replaced': 0, 'files_removed': 0,
+        'chunks_skipped': 0, 'chunks_added': 0, 'chunks_replaced': 0, 'chunks_removed': 0
+    }
+    progress = progress_callback or (lambda filename, stage, **info: None)
     try:
-        embeddings = get_embeddings()
-
-        # Configuration de Chroma avec similarité cosinus
-        client_settings = Settings(
-            persist_directory=PERSIST_DIRECTORY,
-            anonymized_telemetry=False
-        )
-        
-        # Vérifier si le vector store existe déjà
-        if os.path.exists(PERSIST_DIRECTORY):
-            vector_store = Chroma(
-                persist_directory=PERSIST_DIRECTORY, 
-                embedding_function=embeddings,
-                collection_metadata={"hnsw:space": "cosine"}  # Force l'utilisation de la similarité cosinus
-            )
-        else:
-            vector_store = None
+        # Sous le verrou : deux process ne doivent pas créer la collection en même temps
+        with _ingestion_lock:
+            vector_store = get_vector_store(create=True)
+        if vector_store is None:
+            return False
 
         text_splitter = TokenTextSplitter(
             chunk_size=CHUNK_SIZE,
             chunk_overlap=OVERLAP_SIZE
         )
-
-        documents = []
-        metadatas = []
-        total_chunks = 0
-        
-        for filename in os.listdir(UPLOAD_FOLDER):
+        fingerprint = ingestion_fingerprint()
+
+        filenames = os.listdir(UPLOAD_FOLDER)
+        progress(None, 'start', total_files=len(filenames))
+
+        with _ingestion_lock, vector_store_writer():
+            # Suppression des chunks des fichiers qui ne sont plus dans le dossier
+            # (les transcriptions indexées directement n'ont pas de fichier d'upload)
+            manifest = get_manifest()
+            for filename in manifest.filenames():
+                if filename not in filenames and manifest.get(filename).get('origin', 'upload') == 'upload':
+                    removed = delete_document_chunks(vector_store, manifest, filename)
+                    stats['files_removed'] += 1
+                    stats['chunks_removed'] += removed
+                    logging.info(f"Fichier {filename} retiré de l'index ({removed} chunks)")
+
+        for filename in filenames:
             file_path = os.path.join(UPLOAD_FOLDER, filename)
             try:
-                text = read_file(file_path)
-                chunks = text_splitter.split_text(text)
-                total_chunks += len(chunks)
-                
-                for chunk in chunks:
-                    documents.append(chunk)
-                    metadatas.append({"source": filename})
-                    
-                logging.info(f"Fichier {filename} découpé en {len(chunks)} chunks")
-                    
+                with _ingestion_lock, vector_store_writer():
+                    # Manifeste relu sous le verrou : d'autres process ou requêtes l'ont pu modifier
+                    manifest = get_manifest()
+                    if not os.path.exists(file_path):
+                        # Supprimé pendant l'ingestion : delete_file a déjà retiré ses chunks
+                        progress(filename, 'skipped', chunks=0)
+                        continue
+                    content_hash = file_hash(file_path)
+                    entry = manifest.get(filename)
+                    if (entry and entry['hash'] == content_hash and entry['fingerprint'] == fingerprint
+                            and entry.get('complete', True)):
+                        backfill_lexical_index(vector_store, entry)
+                        stats['files_skipped'] += 1
+                        stats['chunks_skipped'] += entry['chunk_count']
+                        progress(filename, 'skipped', chunks=entry['chunk_count'])
+                        continue
+
+                    replaced = entry is not None
+                    if entry:
+                        # Le fichier a changé : on retire les anciens chunks avant d'écrire les nouveaux
+                        delete_document_chunks(vector_store, manifest, filename)
+                    elif vector_store._collection.get(where={"source": filename}, limit=1)['ids']:
+                        # Chunks indexés avant le manifeste (IDs aléatoires) : retirés par leur source
+                        delete_document_chunks(vector_store, manifest, filename)
+                        replaced = True
+                        logging.info(f"Anciens chunks de {filename} (sans manifeste) retirés avant ré-indexation")
+
+                    # Entrée écrite avant les chunks et mise à jour à chaque lot : le manifeste
+                    # couvre toujours les chunks déjà écrits, même si l'ingestion est interrompue
+                    new_entry = {
+                        'hash': content_hash,
+                        'fingerprint': fingerprint,
+                        'id_prefix': chunk_id_prefix(filename, content_hash, fingerprint),
+                        'chunk_count': 0,
+                        'complete': False
+                    }
+                    manifest.set(filename, new_entry)
+
+                    progress(filename, 'parsing')
+                    chunk_count = write_chunks(
+                        vector_store, manifest, filename, new_entry,
+                        iter_document_chunks(file_path, filename, text_splitter),
+                        on_flush=lambda count: progress(filename, 'embedding', chunks=count)
+                    )
+                    new_entry['complete'] = True
+                    manifest.set(filename, new_entry)
+
+                if replaced:
+                    stats['files_replaced'] += 1
+                    stats['chunks_replaced'] += chunk_count
+                else:
+                    stats['files_added'] += 1
+                    stats['chunks_added'] += chunk_count
+                progress(filename, 'done', chunks=chunk_count)
+                logging.info(f"Fichier {filename} découpé en {chunk_count} chunks")
+
             except Exception as e:
+                progress(filename, 'error', error=str(e))
                 logging.error(f"Erreur de traitement de {filename}: {e}")
 
-        logging.info(f"Total de chunks générés: {total_chunks}")
-        
-        if documents:  # Seulement créer/mettre à jour si nous avons des documents
-            if vector_store is None:
-                Chroma.from_texts(
-                    texts=documents,
-                    embedding=embeddings,
-                    metadatas=metadatas,
-                    persist_directory=PERSIST_DIRECTORY,
-                    collection_metadata={"hnsw:space": "cosine"}  # Force l'utilisation de la similarité cosinus
-                )
-            else:
-                vector_store.add_texts(texts=documents, metadatas=metadatas)
-
-            vector_store.persist()
+        logging.info(f"Ingestion terminée: {stats}")
+        return stats
     except Exception as e:
         logging.error(f"Erreur lors du traitement des documents: {str(e)}")
         return False
 
-def get_vector_store():
-    logging.info("Initialisation du vector store")
+class TranscriptIndexer:
+    def __init__(self, key, metadata):
+        """
+        Indexe une transcription dans le vector store au fil de sa production.
+
+        Chaque segment transcrit est découpé, embeddé et écrit dès sa réception :
+        le début d'une longue vidéo est interrogeable avant la fin de la transcription.
+        L'entrée du manifeste (origin 'transcript') n'est pas concernée par le
+        nettoyage des fichiers d'upload. Une erreur d'indexation est journalisée
+        sans interrompre la transcription ; les chunks partiels sont retirés par
+        finish(), ou par abort() si la transcription échoue.
+
+        Args:
+            key (str): Clé du média dans le manifeste (ex: 'youtube:ID')
+            metadata (dict): Métadonnées des chunks (video_id, title, url)
+        """
+        self.key = key
+        self.metadata = {name: value for name, value in metadata.items() if value is not None}
+        self.metadata.setdefault('source', self.metadata.get('title') or key)
+        self.text_splitter = TokenTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=OVERLAP_SIZE)
+        self.entry = None
+        self.error = None
+
+    @property
+    def chunk_count(self):
+        return self.entry['chunk_count'] if self.entry else 0
+
+    @staticmethod
+    def indexed_chunks(key):
+        """Nombre de chunks d'un média déjà indexé en entier avec les paramètres courants, sinon None"""
+        entry = get_manifest().get(key)
+        if entry and entry.get('complete') and entry['fingerprint'] == ingestion_fingerprint():
+            return entry['chunk_count']
+        return None
+
+    def add_segment(self, text):
+        """Indexe le texte d'un segment ; retourne le nombre total de chunks indexés"""
+        if self.error or not text.strip():
+            return self.chunk_count
+        try:
+            with _ingestion_lock:
+                vector_store = get_vector_store(create=True)
+                if vector_store is None:
+                    raise RuntimeError("Vector store indisponible")
+                # Manifeste relu sous le verrou : il est aussi modifié par les ingestions d'uploads
+                manifest = get_manifest()
+                with vector_store_writer():
+                    if self.entry is None:
+                        self._start(vector_store, manifest)
+                    chunks = ((chunk, dict(self.metadata)) for chunk in self.text_splitter.split_text(text))
+                    write_chunks(vector_store, manifest, self.key, self.entry, chunks)
+        except Exception as e:
+            self.error = str(e)
+            logging.error(f"Indexation de la transcription {self.key} interrompue: {self.error}", exc_info=True)
+        return self.chunk_count
+
+    def _start(self, vector_store, manifest):
+        previous = manifest.get(self.key)
+        if previous:
+            if not self.metadata.get('title') and previous.get('title'):
+                # Transcription servie par le cache, sans métadonnées : titre de l'indexation précédente
+                self.metadata['title'] = previous['title']
+                if self.metadata['source'] == self.key:
+                    self.metadata['source'] = previous['title']
+            # Média déjà indexé : ses anciens chunks sont remplacés
+            delete_document_chunks(vector_store, manifest, self.key)
+        fingerprint = ingestion_fingerprint()
+        key_hash = hashlib.sha256(self.key.encode('utf-8')).hexdigest()
+        self.entry = {
+            'origin': 'transcript',
+            'hash': key_hash,
+            'fingerprint': fingerprint,
+            'id_prefix': chunk_id_prefix(self.key, key_hash, fingerprint),
+            'chunk_count': 0,
+            'complete': False,
+            'title': self.metadata.get('title'),
+            'url': self.metadata.get('url')
+        }
+        manifest.set(self.key, self.entry)
+
+    def finish(self):
+        """Marque l'indexation comme complète ; retourne le nombre de chunks indexés"""
+        if self.error:
+            self.abort()
+        elif self.entry is not None:
+            with _ingestion_lock, vector_store_writer():
+                self.entry['complete'] = True
+                get_manifest().set(self.key, self.entry)
+            logging.info(f"Transcription {self.key} indexée en {self.chunk_count} chunks")
+        return self.chunk_count
+
+    def abort(self):
+        """Retire les chunks d'une indexation incomplète, pour qu'ils ne soient pas interrogeables"""
+        if self.entry is None:
+            return
+        with _ingestion_lock:
+            vector_store = get_vector_store()
+            manifest = get_manifest()
+            # L'entrée a pu être remplacée depuis par une autre indexation du même média
+            if vector_store is not None and manifest.get(self.key) == self.entry:
+                with vector_store_writer():
+                    removed = delete_document_chunks(vector_store, manifest, self.key)
+                logging.info(f"Indexation incomplète de {self.key} retirée ({removed} chunks)")
+        self.entry = None
+
+app.config['TRANSCRIPT_INDEXER'] = TranscriptIndexer
+
+def _manifest_generation():
+    """Génération du vector store sur disque (mtime du manifeste, modifié à chaque ingestion)"""
     try:
-        if not os.path.exists(PERSIST_DIRECTORY) or not os.listdir(PERSIST_DIRECTORY):
-            logging.warning("Le dossier de persistance n'existe pas ou est vide")
-            return None
-            
-        embeddings = get_embeddings()
-        vector_store = Chroma(
-            persist_directory=PERSIST_DIRECTORY, 
-            embedding_function=embeddings,
-            collection_metadata={"hnsw:space": "cosine"}  # Force l'utilisation de la similarité cosinus
-        )
-        logging.info(f"Vector store initialisé avec succès. Collection count: {vector_store._collection.count()}")
+        return os.stat(MANIFEST_PATH).st_mtime_ns
+    except OSError:
+        return None
+
+def invalidate_vector_store():
+    """Oublie le vector store partagé : il sera rouvert depuis le disque au prochain accès"""
+    global _vector_store, _vector_store_generation
+    with _store_lock:
+        _vector_store = None
+        _vector_store_generation = None
+        try:
+            # Chroma garde un client par dossier dans le process : on le libère pour relire le disque
+            from chromadb.api.client import SharedSystemClient
+            SharedSystemClient.clear_system_cache()
+        except (ImportError, AttributeError):
+            pass
+
+@contextmanager
+def vector_store_writer():
+    """
+    Encadre une modification du vector store partagé par ce process.
+
+    Pendant l'écriture, les changements du manifeste viennent de nous : le store
+    partagé n'est pas rouvert. À la fin, sa génération est mise à jour.
+    """
+    global _active_writers, _vector_store_generation
+    with _store_lock:
+        _active_writers += 1
+    try:
+        yield
+    finally:
+        with _store_lock:
+            _active_writers -= 1
+            if _vector_store is not None:
+                _vector_store_generation = _manifest_generation()
+
+def get_vector_store(create=False):
+    """
+    Retourne le vector store partagé par le process, ouvert une seule fois.
+
+    Le store est rouvert uniquement si une ingestion faite par un autre process
+    a modifié la collection (détecté via le mtime du manifeste d'ingestion).
+
+    Args:
+        create (bool): Crée la collection si le dossier de persistance n'existe pas encore
+    """
+    global _vector_store, _vector_store_generation
+    generation = _manifest_generation()
+    vector_store = _vector_store
+    if vector_store is not None and (_active_writers or generation == _vector_store_generation):
         return vector_store
+
+    with _store_lock:
+        if _vector_store is not None and not _active_writers and generation != _vector_store_generation:
+            logging.info("Collection modifiée par un autre process, réouverture du vector store")
+            invalidate_vector_store()
+        if _vector_store is not None:
+            return _vector_store
+
+        logging.info("Initialisation du vector store")
+        try:
+            if not create and (not os.path.exists(PERSIST_DIRECTORY) or not os.listdir(PERSIST_DIRECTORY)):
+                logging.warning("Le dossier de persistance n'existe pas ou est vide")
+                return None
+
+            _vector_store = Chroma(
+                persist_directory=PERSIST_DIRECTORY,
+                embedding_function=get_embeddings(),
+                collection_metadata={"hnsw:space": "cosine"}  # Force l'utilisation de la similarité cosinus
+            )
+            _vector_store_generation = generation
+            logging.info(f"Vector store initialisé avec succès. Collection count: {_vector_store._collection.count()}")
+            return _vector_store
+        except Exception as e:
+            logging.error(f"Erreur lors de l'initialisation du vector store: {str(e)}", exc_info=True)
+            return None
+
+def get_lexical_index():
+    """Retourne l'index lexical BM25 partagé par le process"""
+    global _lexical_index
+    if _lexical_index is None:
+        with _store_lock:
+            if _lexical_index is None:
+                _lexical_index = LexicalIndex(LEXICAL_INDEX_PATH)
+    return _lexical_index
+
+def search_documents(vectordb, query, k, hybrid=HYBRID_SEARCH):
+    """
+    Recherche les k chunks les plus pertinents.
+
+    En mode hybride, les classements vectoriel et BM25 sont fusionnés par
+    reciprocal rank fusion, pour retrouver aussi les correspondances exactes
+    (codes produit, noms, acronymes) que la similarité sémantique manque.
+    """
+    docs = vectordb.similarity_search(query, k=k)
+    if not hybrid:
+        return docs
+    try:
+        lexical_docs = get_lexical_index().search(query, k)
     except Exception as e:
-        logging.error(f"Erreur lors de l'initialisation du vector store: {str(e)}", exc_info=True)
-        return None
+        logging.warning(f"Recherche lexicale indisponible: {str(e)}")
+        return docs
+    return reciprocal_rank_fusion([docs, lexical_docs], k)
+
+def fetch_stored_embeddings(vectordb, ids):
+    """Embeddings déjà stockés dans Chroma pour ces chunks (pas de nouvel appel d'embedding)"""
+    result = vectordb._collection.get(ids=ids, include=['embeddings'])
+    return dict(zip(result['ids'], result['embeddings']))
+
+def warm_up_vector_store(eager=EAGER_WARMUP):
+    """Ouvre le vector store au démarrage ; en mode eager, fait aussi une recherche à blanc"""
+    try:
+        vector_store = get_vector_store()
+        if eager and vector_store is not None:
+            start = time.time()
+            if vector_store._collection.count() > 0:
+                vector_store.similarity_search("warm-up", k=1)
+            else:
+                get_embeddings().embed_query("warm-up")
+            logging.info(f"Warm-up du vector store terminé en {time.time() - start:.2f}s")
+    except Exception as e:
+        logging.warning(f"Warm-up du vector store impossible: {str(e)}")
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
@@ -175,7 +600,7 @@ def upload_file():
         return jsonify({'error': 'Clé API requise'}), 400
 
     files = request.files.getlist('file')
-    valid_files = 0
+    saved_files = []
     
     for file in files:
         logging.info(f"Traitement du fichier: {file.filename}")
@@ -183,35 +608,44 @@ def upload_file():
             logging.info(f"-> Fichier valide: {file.filename}")
             filename = secure_filename(file.filename)
             file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
-            valid_files += 1
+            saved_files.append(filename)
     
-    if valid_files == 0:
+    if not saved_files:
         logging.error(f"Aucun fichier valide uploadé : {files}")
         return jsonify({'error': 'Aucun fichier valide'}), 400
-    
-    try:
-        process_documents()
-    except Exception as e:
-        logging.error(f'Erreur de traitement: {str(e)}')
-        return jsonify({'error': str(e)}), 500
-    
-    return jsonify({'message': f'{valid_files} fichiers uploadés'}), 200
+
+    # L'indexation tourne en arrière-plan ; le client suit sa progression via /upload/status
+    job_id = ingestion_queue.submit(str(uuid.uuid4()), saved_files)
+
+    return jsonify({
+        'message': f'{len(saved_files)} fichiers uploadés',
+        'job_id': job_id
+    }), 202
+
+@app.route('/upload/status/<job_id>', methods=['GET'])
+def upload_status(job_id):
+    return jsonify(ingestion_tasks.get_task_status(job_id))
 
 @app.route('/delete/<filename>', methods=['DELETE'])
 def delete_file(filename):
     try:
         file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
         if os.path.exists(file_path):
-            os.remove(file_path)
-            logging.info(f"Fichier supprimé: {filename}")
-            
-            # Régénération complète du vector store
-            if os.path.exists(PERSIST_DIRECTORY):
-                shutil.rmtree(PERSIST_DIRECTORY)
-                logging.info("Ancien vector store supprimé")
-            
-            process_documents()
-            return jsonify({'message': 'Fichier supprimé avec succès'}), 200
+            # Sous le verrou d'ingestion : un job en cours ne peut ni réécrire le manifeste
+            # ni réindexer ce document après sa suppression
+            with _ingestion_lock:
+                os.remove(file_path)
+                logging.info(f"Fichier supprimé: {filename}")
+
+                # Suppression ciblée des chunks du document, sans toucher aux autres embeddings
+                removed = 0
+                if os.path.exists(PERSIST_DIRECTORY):
+                    vector_store = get_vector_store(create=True)
+                    with vector_store_writer():
+                        removed = delete_document_chunks(vector_store, get_manifest(), filename)
+                logging.info(f"Chunks de {filename} supprimés du vector store: {removed}")
+
+            return jsonify({'message': 'Fichier supprimé avec succès', 'chunks_removed': removed}), 200
         return jsonify({'error': 'Fichier non trouvé'}), 404
     except Exception as e:
         logging.error(f'Erreur de suppression: {str(e)}')
@@ -225,8 +659,9 @@ def list_files():
 def reformulate_question(message, api_key, provider="openai"):
     """Reformule la question pour améliorer la recherche RAG"""
     try:
-        client = OpenAI(
+        client = get_client(
             api_key=api_key,
+            provider=provider,
             base_url="https://api.deepseek.com" if provider == "deepseek" else None
         )
         
@@ -252,15 +687,81 @@ def reformulate_question(message, api_key, provider="openai"):
         logging.warning(f"Erreur lors de la reformulation: {str(e)}")
         return message  # En cas d'erreur, on utilise la question originale
 
-@app.route('/chat', methods=['POST'])
-def chat():
-    logging.info('Requête chat reçue')
-    data = request.json  # Récupération des données du corps de la requête
+def format_sources(docs):
+    return [{
+        "source": doc.metadata['source'],
+        "page": doc.metadata.get('page'),
+        "content": doc.page_content,
+        "id": str(uuid.uuid4())[:8]
+    } for doc in docs]
+
+def sse_response(events):
+    response = Response(events, mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def sse_event(payload):
+    return f"data: {json.dumps(payload)}\n\n"
+
+def chat_prelude(prepared):
+    """Événements envoyés avant la réponse : ouverture du flux, mesures et sources"""
+    yield "data: {}\n\n"
+    if prepared['timings']:
+        yield sse_event({'type': 'metrics', 'content': prepared['timings']})
+    if prepared['sources']:
+        yield sse_event({'type': 'sources', 'content': prepared['sources']})
+
+def replay_cached_answer(prepared):
+    """Rejoue une réponse du cache sémantique avec les mêmes événements SSE qu'une génération"""
+    yield from chat_prelude(prepared)
+    yield sse_event({'type': 'response', 'content': prepared['cached_answer']})
+    yield sse_event({'type': 'status', 'content': 'done'})
+
+def store_answer(prepared, answer_parts):
+    """Enregistre une réponse complète dans le cache sémantique (si la requête y est éligible)"""
+    if prepared['query_embedding'] is not None and answer_parts:
+        answer_cache.store(prepared['model'], prepared['query_embedding'], prepared['chunk_ids'],
+                           "".join(answer_parts))
+
+def prepare_chat(data):
+    """
+    Prépare une requête de chat : validation, recherche, cache sémantique et prompt.
+    Partagé par la route Flask synchrone et le point d'entrée asynchrone (asgi.py).
+
+    Args:
+        data (dict): Corps JSON de la requête /chat
+
+    Returns:
+        dict: provider, api_key, base_url, model, messages, sources, timings,
+              cached_answer (réponse du cache ou None), query_embedding, chunk_ids
+
+    Raises:
+        ValueError: Requête invalide (réponse HTTP 400)
+    """
+    data = data or {}
     message = data.get('message')
     api_key = data.get('api_key')
     provider = data.get('provider', 'openai')
     history = data.get('history', [])  # L'historique est déjà un objet JSON
     
+    hybrid = bool(data.get('hybrid', HYBRID_SEARCH))
+    use_answer_cache = bool(data.get('answer_cache', True))
+    reformulation = data.get('reformulation') or REFORMULATION_STRATEGY
+    if reformulation not in REFORMULATION_STRATEGIES:
+        logging.warning(f'Stratégie de reformulation invalide: {reformulation}')
+        reformulation = REFORMULATION_STRATEGY
+    rerank_strategy = data.get('rerank') or RERANK_STRATEGY
+    if rerank_strategy not in RERANK_STRATEGIES:
+        logging.warning(f'Stratégie de reranking invalide: {rerank_strategy}')
+        rerank_strategy = RERANK_STRATEGY
+    try:
+        rerank_candidates = max(1, min(RERANK_MAX_CANDIDATES, int(data.get('rerank_candidates', RERANK_CANDIDATES))))
+        mmr_lambda = max(0.0, min(1.0, float(data.get('mmr_lambda', RERANK_MMR_LAMBDA))))
+    except (TypeError, ValueError):
+        logging.warning('Paramètres de reranking invalides')
+        rerank_candidates, mmr_lambda = RERANK_CANDIDATES, RERANK_MMR_LAMBDA
+
     # Ajout de la gestion du nombre de résultats
     try:
         nb_results = int(data.get('nb_results', '5'))
@@ -272,114 +773,142 @@ def chat():
     
     if not api_key or not message:
         logging.error('Clé API ou message manquant')
-        return jsonify({'error': 'Clé API et message requis'}), 400
+        raise ValueError('Clé API et message requis')
     
     if len(api_key.strip()) < 8:
         logging.error('Clé API invalide')
-        return jsonify({'error': 'Clé API invalide'}), 400
+        raise ValueError('Clé API invalide')
 
-    try:
-        # Le reste de la fonction reste exactement identique
-        reformulated_message = reformulate_question(message, api_key, provider)
-        
-        context = ""
-        sources = []
-        
+    sources = []
+    docs = []
+    timings = {}
+    model = "deepseek-chat" if provider == "deepseek" else "gpt-4o"
+    
+    vectordb = get_vector_store()
+    if vectordb is None:
+        logging.info("Vectordb non initialisé, on l'initialise maintenant a partir des fichiers dans UPLOAD_FOLDER")
+        process_documents()
         vectordb = get_vector_store()
-        if vectordb is not None:
-            collection_count = vectordb._collection.count()
-            if collection_count > 0:
-                actual_results = min(nb_results, collection_count)
-                docs = vectordb.similarity_search(reformulated_message, k=actual_results)
-                context = "\n\n".join([doc.page_content for doc in docs])
-                sources = [{
-                    "source": doc.metadata['source'],
-                    "content": doc.page_content,
-                    "id": str(uuid.uuid4())[:8]
-                } for doc in docs]
-        else:
-            logging.info("Vectordb non initialisé, on l'initialise maintenant a partir des fichiers dans UPLOAD_FOLDER")
-            process_documents()
-            vectordb = get_vector_store()
-            if vectordb is not None:
-                collection_count = vectordb._collection.count()
-                if collection_count > 0:
-                    actual_results = min(nb_results, collection_count)
-                    docs = vectordb.similarity_search(reformulated_message, k=actual_results)
-                    context = "\n\n".join([doc.page_content for doc in docs])
-                    sources = [{
-                        "source": doc.metadata['source'],
-                        "content": doc.page_content,
-                        "id": str(uuid.uuid4())[:8]
-                    } for doc in docs]
-
-        def generate():
-            try:
-                yield "data: {}\n\n"
-
-                if sources:
-                    sources_json = json.dumps({'type': 'sources', 'content': sources})
-                    yield f"data: {sources_json}\n\n"
-                
-                client = OpenAI(
-                    api_key=api_key,
-                    base_url="https://api.deepseek.com" if provider == "deepseek" else None
-                )
-                
-                model = "deepseek-chat" if provider == "deepseek" else "gpt-4o"
-                
-                system_prompt = (
-                    """Tu es un assistant de création de contenu de formation, alimenté par une recherche documentaire.
-                    Sers-toi des informations fournies pour répondre à la question de l'utilisateur, en citant les passages pertinents provenant du contenu qui t'ont aider a répondre.
-                    Quand tu cite, utilise le format suivant : "(source: nom du document, page: numéro de page)".
-                    """
-                )
-                
-                messages = [{"role": "system", "content": system_prompt}]
-                
-                if history:
-                    messages.extend(history)
-                
-                logging.info(f"Contexte RAG: {len(context)} caractères")
-                if context:
-                    messages.append({
-                        "role": "assistant",
-                        "content": "D'après les documents consultés, voici les informations pertinentes :\n\n" + context
-                    })
-                
-                messages.append({"role": "user", "content": message})
-                
-                response = client.chat.completions.create(
-                    model=model,
-                    messages=messages,
-                    stream=True
-                )
-                
-                for chunk in response:
-                    if chunk.choices and chunk.choices[0].delta.content:
-                        content = chunk.choices[0].delta.content
-                        chunk_json = json.dumps({'type': 'response', 'content': content})
-                        yield f"data: {chunk_json}\n\n"
-                        if hasattr(response, 'flush'):
-                            response.flush()
-
-                yield f"data: {json.dumps({'type': 'status', 'content': 'done'})}\n\n"
-            
-            except Exception as e:
-                logging.error(f"Erreur pendant la génération: {str(e)}", exc_info=True)
-                error_json = json.dumps({'type': 'error', 'content': str(e)})
-                yield f"data: {error_json}\n\n"
-                yield f"data: {json.dumps({'type': 'status', 'content': 'done'})}\n\n"
 
-        response = Response(generate(), mimetype='text/event-stream')
-        response.headers['Cache-Control'] = 'no-cache'
-        response.headers['X-Accel-Buffering'] = 'no'
-        return response
+    if vectordb is not None:
+        collection_count = vectordb._collection.count()
+        if collection_count > 0:
+            actual_results = min(nb_results, collection_count)
+            # Avec reranking, la recherche ramène un pool plus large, réduit ensuite à actual_results
+            pool_size = actual_results
+            if rerank_strategy != 'off' and actual_results > 0:
+                pool_size = min(max(rerank_candidates, actual_results), collection_count)
+            docs, query, timings = retrieve_with_reformulation(
+                reformulation, message, pool_size,
+                retrieve=lambda query: search_documents(vectordb, query, pool_size, hybrid),
+                reformulate=lambda question: reformulate_question(question, api_key, provider),
+                cache=reformulation_cache,
+                provider=provider,
+                timeout=REFORMULATION_TIMEOUT
+            )
+            if rerank_strategy != 'off':
+                docs, timings['rerank'] = rerank(
+                    rerank_strategy, query, docs, actual_results,
+                    embed_query=get_embeddings().embed_query,
+                    fetch_embeddings=lambda ids: fetch_stored_embeddings(vectordb, ids),
+                    mmr_lambda=mmr_lambda,
+                    model_name=RERANK_MODEL,
+                    batch_size=RERANK_BATCH_SIZE
+                )
+            logging.info(f"Latences de la recherche: {timings}")
+            sources = format_sources(docs)
+
+    prepared = {
+        'provider': provider,
+        'api_key': api_key,
+        'base_url': "https://api.deepseek.com" if provider == "deepseek" else None,
+        'model': model,
+        'messages': None,
+        'sources': sources,
+        'timings': timings,
+        'cached_answer': None,
+        'query_embedding': None,
+        'chunk_ids': [doc.id for doc in docs]
+    }
+
+    # Cache sémantique : seulement pour une première question (sans historique de réponses)
+    # et quand la réponse s'appuie sur des chunks identifiés
+    if (use_answer_cache and docs and all(prepared['chunk_ids'])
+            and not any(turn.get('role') == 'assistant' for turn in history)):
+        try:
+            prepared['query_embedding'] = get_embeddings().embed_query(message)
+            prepared['cached_answer'] = answer_cache.lookup(model, prepared['query_embedding'], prepared['chunk_ids'])
+        except Exception as e:
+            logging.warning(f"Cache de réponses indisponible: {str(e)}")
+            prepared['query_embedding'] = None
+        if prepared['cached_answer'] is not None:
+            logging.info("Réponse servie depuis le cache sémantique")
+            timings['answer_cache'] = 'hit'
+            return prepared
+
+    system_prompt = (
+        """Tu es un assistant de création de contenu de formation, alimenté par une recherche documentaire.
+        Sers-toi des informations fournies pour répondre à la question de l'utilisateur, en citant les passages pertinents provenant du contenu qui t'ont aider a répondre.
+        Quand tu cite, utilise le format suivant : "(source: nom du document, page: numéro de page)".
+        """
+    )
+    prompt_builder = PromptBuilder(model, max_output_tokens=PROMPT_MAX_OUTPUT_TOKENS,
+                                   context_share=PROMPT_CONTEXT_SHARE)
+    prepared['messages'], timings['prompt_tokens'] = prompt_builder.build(
+        system_prompt, history, docs, message,
+        context_intro="D'après les documents consultés, voici les informations pertinentes :\n\n"
+    )
+    logging.info(f"Tokens du prompt: {timings['prompt_tokens']}")
+    return prepared
 
+@app.route('/chat', methods=['POST'])
+def chat():
+    logging.info('Requête chat reçue')
+    try:
+        prepared = prepare_chat(request.json)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logging.error(f'Erreur globale du chat: {str(e)}', exc_info=True)
         return jsonify({'error': str(e)}), 500
 
+    if prepared['cached_answer'] is not None:
+        return sse_response(replay_cached_answer(prepared))
+
+    def generate():
+        response = None
+        try:
+            yield from chat_prelude(prepared)
+            
+            client = get_client(api_key=prepared['api_key'], provider=prepared['provider'],
+                                base_url=prepared['base_url'])
+            response = client.chat.completions.create(
+                model=prepared['model'],
+                messages=prepared['messages'],
+                stream=True
+            )
+            
+            answer_parts = []
+            for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    content = chunk.choices[0].delta.content
+                    answer_parts.append(content)
+                    yield sse_event({'type': 'response', 'content': content})
+
+            store_answer(prepared, answer_parts)
+            yield sse_event({'type': 'status', 'content': 'done'})
+        
+        except Exception as e:
+            logging.error(f"Erreur pendant la génération: {str(e)}", exc_info=True)
+            yield sse_event({'type': 'error', 'content': str(e)})
+            yield sse_event({'type': 'status', 'content': 'done'})
+        finally:
+            # Client déconnecté (GeneratorExit) : fermer le flux amont arrête la génération
+            if response is not None:
+                response.close()
+
+    return sse_response(generate())
+
 
 @app.route('/set_api_key', methods=['POST'])
 def set_api_key():
@@ -389,11 +918,23 @@ def set_api_key():
 @app.route('/refresh_vector_db', methods=['POST'])
 def refresh_vector_db():
     try:
-        process_documents()
-        return jsonify({'message': 'Vecteur DB rafraîchi'}), 200
+        stats = process_documents()
+        if stats is False:
+            return jsonify({'error': "Erreur lors de l'indexation des documents"}), 500
+        return jsonify({'message': 'Vecteur DB rafraîchi', 'stats': stats}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    return jsonify({
+        'query_embeddings': query_embedding_cache.stats(),
+        'reformulations': reformulation_cache.stats(),
+        'answers': answer_cache.stats(),
+        'llm_clients': llm_client_registry.stats(),
+        'youtube_search': youtube_manager.searcher.stats()
+    })
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -414,6 +955,14 @@ def get_file_size(filename):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Jobs d'ingestion en arrière-plan (un seul à la fois, uploads concurrents regroupés)
+ingestion_tasks = TaskManager()
+ingestion_queue = IngestionJobQueue(process_documents, ingestion_tasks)
+
+# Chargement du vector store partagé sans bloquer le démarrage du worker
+if not POOL_WORKER:
+    threading.Thread(target=warm_up_vector_store, daemon=True).start()
+
 # Enregistrement des blueprints
 app.register_blueprint(youtube_bp, url_prefix='/youtube')
 app.register_blueprint(social_media_bp, url_prefix='/social')  # Nouveau blueprint
@@ -0,0 +1,185 @@
+# asgi.py
+"""
+Point d'entrée ASGI de l'application.
+
+/chat est servi nativement en asyncio avec le client OpenAI asynchrone : un flux
+en cours n'occupe plus de worker, et la déconnexion du client annule la
+complétion en amont. Le flux de statut des tâches YouTube est lui aussi servi
+nativement : il reste ouvert toute la durée d'une transcription sans occuper de
+thread Flask. Toutes les autres routes passent par l'application Flask,
+exécutée dans un pool de FLASK_WORKERS threads : une route lente ou un flux
+n'empêche pas les autres requêtes du worker d'être servies.
+
+Lancement :
+    uvicorn asgi:application --host 0.0.0.0 --port 18900 --workers 4
+"""
+import re
+import json
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from a2wsgi import WSGIMiddleware
+from llm_clients import get_async_client
+from app import app, prepare_chat, chat_prelude, replay_cached_answer, store_answer, sse_event
+from tasks import FINAL_STATUSES, POLL_INTERVAL
+from youtube_routes import task_manager, STREAM_MIN_INTERVAL, STREAM_KEEPALIVE
+
+SSE_HEADERS = [
+    (b'content-type', b'text/event-stream'),
+    (b'cache-control', b'no-cache'),
+    (b'x-accel-buffering', b'no'),
+]
+
+FLASK_WORKERS = 16  # Requêtes Flask servies simultanément par worker ASGI
+STATUS_WAIT_WORKERS = 32  # Threads d'attente partagés par les flux de statut ouverts
+STATUS_STREAM_PATH = re.compile(r'^/youtube/status/([^/]+)/stream$')
+
+# WsgiToAsgi (asgiref) exécute toutes les requêtes WSGI sur un seul thread : une
+# route lente bloquerait les autres. a2wsgi utilise un vrai pool de threads.
+flask_application = WSGIMiddleware(app, workers=FLASK_WORKERS)
+# Pool dédié : les attentes des flux de statut ne retardent pas les to_thread de /chat
+status_executor = ThreadPoolExecutor(max_workers=STATUS_WAIT_WORKERS, thread_name_prefix='status')
+
+
+async def read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+async def send_json(send, status, payload):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json')]})
+    await send({'type': 'http.response.body', 'body': json.dumps(payload).encode('utf-8')})
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def send_until_disconnect(producer, receive, send):
+    """Exécute le producteur d'un flux SSE ; l'annule si le client se déconnecte"""
+    producer = asyncio.create_task(producer)
+    disconnect = asyncio.create_task(wait_for_disconnect(receive))
+    done, _ = await asyncio.wait({producer, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+
+    if disconnect in done:
+        producer.cancel()
+        try:
+            await producer
+        except asyncio.CancelledError:
+            pass
+        return False
+
+    disconnect.cancel()
+    await send({'type': 'http.response.body', 'body': b''})
+    return True
+
+
+async def stream_answer(prepared, send):
+    """Envoie les événements SSE de la réponse au fur et à mesure de la génération"""
+    async def send_event(event):
+        await send({'type': 'http.response.body', 'body': event.encode('utf-8'), 'more_body': True})
+
+    if prepared['cached_answer'] is not None:
+        for event in replay_cached_answer(prepared):
+            await send_event(event)
+        return
+
+    try:
+        for event in chat_prelude(prepared):
+            await send_event(event)
+
+        client = get_async_client(api_key=prepared['api_key'], provider=prepared['provider'],
+                                  base_url=prepared['base_url'])
+        response = await client.chat.completions.create(
+            model=prepared['model'],
+            messages=prepared['messages'],
+            stream=True
+        )
+        answer_parts = []
+        # La sortie du bloc (fin, erreur ou annulation) ferme la connexion amont
+        async with response:
+            async for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    content = chunk.choices[0].delta.content
+                    answer_parts.append(content)
+                    await send_event(sse_event({'type': 'response', 'content': content}))
+
+        store_answer(prepared, answer_parts)
+        await send_event(sse_event({'type': 'status', 'content': 'done'}))
+
+    except Exception as e:
+        logging.error(f"Erreur pendant la génération: {str(e)}", exc_info=True)
+        await send_event(sse_event({'type': 'error', 'content': str(e)}))
+        await send_event(sse_event({'type': 'status', 'content': 'done'}))
+
+
+async def chat(scope, receive, send):
+    logging.info('Requête chat reçue (asgi)')
+    body = await read_body(receive)
+    if body is None:
+        return
+    try:
+        data = json.loads(body or b'{}')
+        # Recherche, embeddings et Chroma sont synchrones : exécutés hors de la boucle d'événements
+        prepared = await asyncio.to_thread(prepare_chat, data)
+    except ValueError as e:
+        await send_json(send, 400, {'error': str(e)})
+        return
+    except Exception as e:
+        logging.error(f'Erreur globale du chat: {str(e)}', exc_info=True)
+        await send_json(send, 500, {'error': str(e)})
+        return
+
+    await send({'type': 'http.response.start', 'status': 200, 'headers': SSE_HEADERS})
+    if not await send_until_disconnect(stream_answer(prepared, send), receive, send):
+        logging.info("Client déconnecté, génération annulée")
+
+
+async def stream_task_status(task_id, send):
+    """Envoie le statut d'une tâche à chaque mise à jour, jusqu'à sa fin"""
+    async def send_event(event):
+        await send({'type': 'http.response.body', 'body': event.encode('utf-8'), 'more_body': True})
+
+    loop = asyncio.get_running_loop()
+    last_update = None
+    last_sent = time.monotonic()
+    while True:
+        # Attentes courtes : un thread du pool n'est jamais retenu plus de POLL_INTERVAL par un flux
+        updated, task_status = await loop.run_in_executor(
+            status_executor, task_manager.wait_for_update, task_id, last_update, POLL_INTERVAL
+        )
+        if updated is None and task_status is None:
+            if time.monotonic() - last_sent >= STREAM_KEEPALIVE:
+                await send_event(": keepalive\n\n")
+                last_sent = time.monotonic()
+            continue
+        # Seul le dernier état est envoyé : les mises à jour rapprochées sont regroupées
+        await send_event(f"data: {json.dumps(task_status)}\n\n")
+        last_sent = time.monotonic()
+        if updated is None or task_status.get('status') in FINAL_STATUSES:
+            return
+        last_update = updated
+        await asyncio.sleep(STREAM_MIN_INTERVAL)
+
+
+async def status_stream(task_id, receive, send):
+    await send({'type': 'http.response.start', 'status': 200, 'headers': SSE_HEADERS})
+    await send_until_disconnect(stream_task_status(task_id, send), receive, send)
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and scope['path'] == '/chat' and scope['method'] == 'POST':
+        await chat(scope, receive, send)
+    elif scope['type'] == 'http' and scope['method'] == 'GET' and STATUS_STREAM_PATH.match(scope['path']):
+        await status_stream(STATUS_STREAM_PATH.match(scope['path']).group(1), receive, send)
+    else:
+        await flask_application(scope, receive, send)
@@ -0,0 +1,150 @@
+import os
+import re
+import sqlite3
+import logging
+import threading
+from langchain_core.documents import Document
+
+MMAP_SIZE = 256 * 1024 * 1024  # Taille maximale mappée en mémoire par connexion
+RRF_K = 60  # Constante de la reciprocal rank fusion
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+class LexicalIndex:
+    def __init__(self, path, mmap_size=MMAP_SIZE):
+        """
+        Index inversé BM25 sur disque des chunks, basé sur SQLite FTS5.
+
+        Le texte des chunks est stocké dans une table ordinaire, l'index FTS5
+        (external content) est tenu à jour par des triggers. La base est lue via
+        mmap, en mode WAL pour que les lectures ne bloquent pas l'ingestion.
+
+        Args:
+            path (str): Chemin de la base SQLite
+            mmap_size (int): Taille maximale mappée en mémoire par connexion
+        """
+        self.path = path
+        self.mmap_size = mmap_size
+        self.local = threading.local()
+        self.write_lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+        conn = self._connection()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                rowid INTEGER PRIMARY KEY,
+                chunk_id TEXT UNIQUE NOT NULL,
+                source TEXT,
+                page INTEGER,
+                content TEXT
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+                content, content='chunks', content_rowid='rowid',
+                tokenize='unicode61 remove_diacritics 2'
+            );
+            CREATE TRIGGER IF NOT EXISTS chunks_ai AFTER INSERT ON chunks BEGIN
+                INSERT INTO chunks_fts(rowid, content) VALUES (new.rowid, new.content);
+            END;
+            CREATE TRIGGER IF NOT EXISTS chunks_ad AFTER DELETE ON chunks BEGIN
+                INSERT INTO chunks_fts(chunks_fts, rowid, content) VALUES ('delete', old.rowid, old.content);
+            END;
+        """)
+        conn.commit()
+
+    def _connection(self):
+        """Une connexion par thread (les connexions SQLite ne se partagent pas entre threads)"""
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+            self.local.conn = conn
+        return conn
+
+    def add(self, ids, texts, metadatas):
+        """Ajoute ou remplace des chunks dans l'index"""
+        rows = [
+            (chunk_id, metadata.get('source'), metadata.get('page'), text)
+            for chunk_id, text, metadata in zip(ids, texts, metadatas)
+        ]
+        with self.write_lock:
+            conn = self._connection()
+            with conn:
+                conn.executemany("DELETE FROM chunks WHERE chunk_id = ?", [(row[0],) for row in rows])
+                conn.executemany(
+                    "INSERT INTO chunks (chunk_id, source, page, content) VALUES (?, ?, ?, ?)", rows
+                )
+
+    def delete(self, ids=None, source=None):
+        """Supprime des chunks par IDs, ou tous les chunks d'une source"""
+        with self.write_lock:
+            conn = self._connection()
+            with conn:
+                if ids:
+                    conn.executemany("DELETE FROM chunks WHERE chunk_id = ?", [(chunk_id,) for chunk_id in ids])
+                if source is not None:
+                    conn.execute("DELETE FROM chunks WHERE source = ?", (source,))
+
+    def contains(self, chunk_id):
+        row = self._connection().execute(
+            "SELECT 1 FROM chunks WHERE chunk_id = ?", (chunk_id,)
+        ).fetchone()
+        return row is not None
+
+    @staticmethod
+    def build_query(text):
+        """Transforme une question en requête FTS5 : OU entre les termes, chacun échappé"""
+        terms = {token for token in _TOKEN_RE.findall(text.lower()) if len(token) > 1}
+        return " OR ".join(f'"{term}"' for term in sorted(terms))
+
+    def search(self, text, k):
+        """
+        Recherche BM25.
+
+        Returns:
+            list: Documents triés par pertinence décroissante (id = chunk_id)
+        """
+        query = self.build_query(text)
+        if not query:
+            return []
+        try:
+            rows = self._connection().execute(
+                """
+                SELECT c.chunk_id, c.source, c.page, c.content
+                FROM chunks_fts JOIN chunks c ON c.rowid = chunks_fts.rowid
+                WHERE chunks_fts MATCH ?
+                ORDER BY bm25(chunks_fts)
+                LIMIT ?
+                """,
+                (query, k)
+            ).fetchall()
+        except sqlite3.OperationalError as e:
+            logging.warning(f"Recherche lexicale impossible: {str(e)}")
+            return []
+
+        docs = []
+        for chunk_id, source, page, content in rows:
+            metadata = {'source': source}
+            if page is not None:
+                metadata['page'] = page
+            docs.append(Document(page_content=content, metadata=metadata, id=chunk_id))
+        return docs
+
+
+def reciprocal_rank_fusion(result_lists, k, rrf_k=RRF_K):
+    """
+    Fusionne plusieurs classements de documents par reciprocal rank fusion.
+
+    Returns:
+        list: Les k documents de meilleur score fusionné
+    """
+    scores = {}
+    docs = {}
+    for results in result_lists:
+        for rank, doc in enumerate(results):
+            key = doc.id or doc.page_content
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank + 1)
+            docs.setdefault(key, doc)
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    return [docs[key] for key in ranked[:k]]
@@ -0,0 +1,162 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from transcription_cache import media_key
+
+DOWNLOAD_WORKERS = 3  # Téléchargements simultanés (réseau)
+TRANSCRIBE_WORKERS = 2  # Vidéos transcrites simultanément (chacune découpée en segments parallèles)
+MAX_VIDEOS = 500  # Nombre maximal de vidéos d'un lot
+MAX_ERRORS_REPORTED = 20
+
+
+class BulkTranscriber:
+    def __init__(self, youtube_manager, transcriber, task_manager, output_dir,
+                 download_workers=DOWNLOAD_WORKERS, transcribe_workers=TRANSCRIBE_WORKERS, indexer_class=None):
+        """
+        Transcription en lot d'une playlist ou d'une chaîne YouTube.
+
+        Téléchargement et transcription sont deux étapes qui se recouvrent, avec
+        chacune son pool : une vidéo est transcrite pendant que les suivantes se
+        téléchargent. Le nombre de fichiers audio téléchargés en attente de
+        transcription est borné, pour ne pas remplir le disque. Les vidéos déjà
+        transcrites (cache des transcriptions) ne sont ni téléchargées ni envoyées à l'API,
+        ni ré-indexées si elles le sont déjà.
+
+        Args:
+            youtube_manager (YoutubeManager): Extraction de la playlist et téléchargements
+            transcriber (AudioTranscriberOpenAI): Transcripteur partagé par les vidéos du lot
+            task_manager (TaskManager): Stockage du statut du lot
+            output_dir (str): Dossier des transcriptions du lot
+            download_workers (int): Téléchargements simultanés
+            transcribe_workers (int): Transcriptions simultanées
+            indexer_class (type): Optionnel, indexeur RAG (voir TranscriptIndexer) appliqué à chaque transcription
+        """
+        self.youtube_manager = youtube_manager
+        self.transcriber = transcriber
+        self.task_manager = task_manager
+        self.output_dir = output_dir
+        self.download_workers = download_workers
+        self.transcribe_workers = transcribe_workers
+        self.indexer_class = indexer_class
+        self.lock = threading.Lock()
+        # Fichiers téléchargés non encore transcrits : au plus deux par worker de transcription
+        self.ready_slots = threading.BoundedSemaphore(transcribe_workers * 2)
+
+    def run(self, task_id, url, limit=MAX_VIDEOS):
+        """
+        Exécute le lot et retourne ses statistiques.
+
+        Returns:
+            dict: Compteurs (total, ignorées, transcrites, erreurs) et débit
+        """
+        self.task_id = task_id
+        self.started = time.time()
+        self.stats = {'total': 0, 'skipped': 0, 'downloaded': 0, 'transcribed': 0, 'failed': 0,
+                      'downloaded_bytes': 0, 'indexed_chunks': 0}
+        self.errors = []
+        self.report({'status': 'processing', 'stage': 'expanding', 'progress': 0})
+
+        videos = self.youtube_manager.expand_playlist(url, limit=min(int(limit or MAX_VIDEOS), MAX_VIDEOS))
+        self.stats['total'] = len(videos)
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        todo = []
+        for video in videos:
+            cached = self.transcriber.cache.get(media_key(video['url']))
+            if cached is None:
+                todo.append(video)
+                continue
+            # Déjà transcrite : écrite dans le lot depuis le cache, sans téléchargement ni API
+            self.save(video, cached)
+            with self.lock:
+                self.stats['skipped'] += 1
+        self.report({'stage': 'running'})
+
+        with ThreadPoolExecutor(self.download_workers, thread_name_prefix='bulk-dl') as downloads, \
+                ThreadPoolExecutor(self.transcribe_workers, thread_name_prefix='bulk-tr') as transcriptions:
+            transcription_futures = []
+            futures_lock = threading.Lock()
+
+            def download(video):
+                self.ready_slots.acquire()
+                try:
+                    audio_path = self.youtube_manager.download_audio(video['url'])['path']
+                    with self.lock:
+                        self.stats['downloaded'] += 1
+                        self.stats['downloaded_bytes'] += os.path.getsize(audio_path)
+                except Exception as e:
+                    self.ready_slots.release()
+                    self.fail(video, 'download', e)
+                    return
+                self.report()
+                with futures_lock:
+                    transcription_futures.append(transcriptions.submit(transcribe, video, audio_path))
+
+            def transcribe(video, audio_path):
+                try:
+                    transcript = self.transcriber.transcript_mp3(audio_path, cache_keys=[media_key(video['url'])])
+                    self.save(video, transcript)
+                    with self.lock:
+                        self.stats['transcribed'] += 1
+                except Exception as e:
+                    self.fail(video, 'transcription', e)
+                finally:
+                    self.ready_slots.release()
+                    if os.path.exists(audio_path):
+                        os.remove(audio_path)
+                self.report()
+
+            wait([downloads.submit(download, video) for video in todo])
+            with futures_lock:
+                pending = list(transcription_futures)
+            wait(pending)
+
+        self.report({'status': 'completed', 'stage': 'done', 'progress': 100})
+        logging.info(f"Lot {task_id} terminé: {self.stats}")
+        return self.stats
+
+    def save(self, video, transcript):
+        with open(os.path.join(self.output_dir, f"{video['video_id']}.txt"), 'w', encoding='utf-8') as f:
+            f.write(transcript)
+        if self.indexer_class is not None:
+            key = media_key(video['url']) or f"url:{video['video_id']}"
+            if self.indexer_class.indexed_chunks(key) is not None:
+                # Déjà indexée (relance d'un lot) : rien à ré-embedder
+                return
+            indexer = self.indexer_class(key, video)
+            indexer.add_segment(transcript)
+            with self.lock:
+                self.stats['indexed_chunks'] += indexer.finish()
+
+    def fail(self, video, stage, error):
+        logging.error(f"Lot {self.task_id}: échec ({stage}) de {video['url']}: {str(error)}")
+        with self.lock:
+            self.stats['failed'] += 1
+            if len(self.errors) < MAX_ERRORS_REPORTED:
+                self.errors.append({'video_id': video['video_id'], 'stage': stage, 'error': str(error)})
+        self.report()
+
+    def report(self, status_data=None):
+        """Publie la progression agrégée et le débit du lot"""
+        with self.lock:
+            stats = dict(self.stats)
+            errors = list(self.errors)
+        elapsed = time.time() - self.started
+        done = stats['skipped'] + stats['transcribed'] + stats['failed']
+        processed = stats['transcribed'] + stats['failed']
+        remaining = stats['total'] - done
+        rate = processed / elapsed * 60 if elapsed > 0 else 0
+        data = {
+            'bulk': True,
+            'progress': done / stats['total'] * 100 if stats['total'] else 0,
+            'stats': stats,
+            'errors': errors,
+            'elapsed': round(elapsed, 1),
+            'videos_per_minute': round(rate, 2),
+            'download_mbps': round(stats['downloaded_bytes'] * 8 / elapsed / 1e6, 2) if elapsed > 0 else 0,
+            'eta': round(remaining / rate * 60) if rate > 0 else None
+        }
+        data.update(status_data or {})
+        self.task_manager.update_task_status(self.task_id, data)
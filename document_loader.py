@@ -0,0 +1,118 @@
+import os
+import logging
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import PyPDF2
+
+PDF_WORKERS = max(1, (os.cpu_count() or 2) - 1)  # Processus d'extraction PDF
+PDF_PAGES_PER_TASK = 8  # Pages extraites par tâche envoyée au pool
+TEXT_BLOCK_SIZE = 64 * 1024  # Taille cible (en caractères) des blocs lus dans les fichiers texte
+
+_pdf_pool = None
+_pdf_pool_lock = threading.Lock()
+
+
+def _get_pdf_pool():
+    """
+    Pool de processus partagé pour l'extraction PDF, créé au premier gros PDF.
+
+    Processus démarrés en spawn : le pool est créé depuis un thread d'ingestion
+    alors que d'autres threads tiennent des verrous (logging, pools HTTP, SQLite),
+    qu'un fork copierait verrouillés dans les processus fils. Chaque worker
+    ré-importe le module principal (app.py lancé directement) : app.py ne démarre
+    alors rien (POOL_WORKER), et ses singletons n'ouvrent rien à la construction.
+    """
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            _pdf_pool = ProcessPoolExecutor(max_workers=PDF_WORKERS,
+                                            mp_context=multiprocessing.get_context('spawn'))
+        return _pdf_pool
+
+
+def _extract_pdf_pages(file_path, start, end):
+    """Extrait le texte des pages [start, end) ; exécuté dans un processus du pool"""
+    with open(file_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        return [(i + 1, pdf_reader.pages[i].extract_text() or "") for i in range(start, end)]
+
+
+def iter_pdf_pages(file_path):
+    """
+    Extrait le texte d'un PDF page par page, en répartissant les pages sur un pool de processus.
+
+    Yields:
+        tuple: (numéro de page à partir de 1, texte), dans l'ordre des pages
+    """
+    with open(file_path, 'rb') as file:
+        page_count = len(PyPDF2.PdfReader(file).pages)
+
+    if page_count <= PDF_PAGES_PER_TASK or PDF_WORKERS <= 1:
+        yield from _extract_pdf_pages(file_path, 0, page_count)
+        return
+
+    logging.info(f"Extraction parallèle de {page_count} pages: {file_path}")
+    pool = _get_pdf_pool()
+    ranges = iter(range(0, page_count, PDF_PAGES_PER_TASK))
+    futures = deque()
+
+    def submit_next():
+        start = next(ranges, None)
+        if start is not None:
+            futures.append(pool.submit(_extract_pdf_pages, file_path, start,
+                                       min(start + PDF_PAGES_PER_TASK, page_count)))
+
+    # Fenêtre bornée de lots en cours : la mémoire ne dépend pas du nombre de pages
+    for _ in range(PDF_WORKERS * 2):
+        submit_next()
+    try:
+        # Les résultats sont rendus dans l'ordre, dès que chaque lot de pages est prêt
+        while futures:
+            pages = futures.popleft().result()
+            submit_next()
+            yield from pages
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def iter_text_pages(file_path, block_size=TEXT_BLOCK_SIZE):
+    """
+    Lit un fichier texte par blocs de paragraphes d'environ block_size caractères,
+    sans charger le fichier entier. Un fichier texte n'a pas de numéro de page.
+
+    Yields:
+        tuple: (None, bloc de texte)
+    """
+    block = []
+    block_length = 0
+    with open(file_path, 'r', encoding='utf-8') as file:
+        for line in file:
+            block.append(line)
+            block_length += len(line)
+            # On coupe de préférence sur une ligne vide (fin de paragraphe)
+            if block_length >= block_size and (not line.strip() or block_length >= 2 * block_size):
+                yield None, "".join(block)
+                block = []
+                block_length = 0
+    if block:
+        yield None, "".join(block)
+
+
+def iter_document_pages(file_path):
+    """
+    Itère sur le texte d'un document, page par page pour les formats paginés.
+
+    Yields:
+        tuple: (numéro de page ou None, texte)
+    """
+    extension = file_path.split('.')[-1].lower()
+    if extension == 'txt':
+        return iter_text_pages(file_path)
+    elif extension == 'pdf':
+        return iter_pdf_pages(file_path)
+    else:
+        raise ValueError(f"Type de fichier non supporté: {extension}")
+
@@ -0,0 +1,233 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows : verrou limité au process
+    fcntl = None
+
+
+def file_hash(file_path, block_size=1024 * 1024):
+    """Calcule le hash SHA-256 du contenu d'un fichier, lu par blocs."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunking_fingerprint(**params):
+    """Empreinte des paramètres de découpage/embedding (taille, overlap, modèle...)."""
+    payload = json.dumps(params, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def chunk_id_prefix(key, content_hash, fingerprint):
+    """
+    Préfixe déterministe des IDs de chunks d'un document.
+
+    Dérivé de la clé du manifeste (nom du fichier) et du contenu : deux fichiers
+    identiques sous des noms différents ont des chunks distincts.
+    """
+    digest = hashlib.sha256(f"{key}\0{content_hash}".encode('utf-8')).hexdigest()
+    return f"{digest[:16]}-{fingerprint[:8]}"
+
+
+def chunk_id(id_prefix, index):
+    return f"{id_prefix}-{index}"
+
+
+def chunk_ids(entry):
+    """Reconstruit la liste des IDs de chunks d'une entrée du manifeste."""
+    return [chunk_id(entry['id_prefix'], i) for i in range(entry.get('chunk_count', 0))]
+
+
+class IngestionLock:
+    def __init__(self, path):
+        """
+        Verrou d'écriture d'un vector store, partagé par les threads et les process.
+
+        Les workers (uvicorn --workers, gunicorn) écrivent dans le même dossier
+        Chroma et le même manifeste : un verrou fcntl.flock sur un fichier à côté
+        du store sérialise leurs écritures. Sans fcntl (Windows), seul le verrou
+        du process est pris.
+
+        Args:
+            path (str): Chemin du fichier de verrou
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = None
+
+    def __enter__(self):
+        self.lock.acquire()
+        if fcntl is None:
+            return self
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self.file = open(self.path, 'a')
+            fcntl.flock(self.file, fcntl.LOCK_EX)
+        except BaseException:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+            self.lock.release()
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        if self.file is not None:
+            # Fermer le fichier libère le verrou flock
+            self.file.close()
+            self.file = None
+        self.lock.release()
+
+
+class IngestionManifest:
+    def __init__(self, path):
+        """
+        Manifeste persistant des documents indexés dans le vector store.
+
+        Chaque entrée est indexée par nom de fichier et contient le hash du contenu,
+        l'empreinte des paramètres de découpage et le nombre de chunks écrits, ce qui
+        permet de retrouver les IDs déterministes des chunks.
+
+        Args:
+            path (str): Chemin du fichier JSON du manifeste
+        """
+        self.path = path
+        self.lock = threading.RLock()
+        self.entries = {}
+        self.load()
+
+    def load(self):
+        with self.lock:
+            if not os.path.exists(self.path):
+                self.entries = {}
+                return
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f).get('files', {})
+            except (OSError, ValueError) as e:
+                logging.warning(f"Manifeste d'ingestion illisible ({self.path}), réinitialisation: {e}")
+                self.entries = {}
+
+    def save(self):
+        with self.lock:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'files': self.entries}, f)
+            os.replace(tmp_path, self.path)
+
+    def get(self, filename):
+        with self.lock:
+            return self.entries.get(filename)
+
+    def set(self, filename, entry):
+        with self.lock:
+            self.entries[filename] = entry
+            self.save()
+
+    def remove(self, filename):
+        with self.lock:
+            entry = self.entries.pop(filename, None)
+            if entry is not None:
+                self.save()
+            return entry
+
+    def filenames(self):
+        with self.lock:
+            return list(self.entries)
+
+
+class IngestionJobQueue:
+    def __init__(self, run_ingestion, task_manager):
+        """
+        File de jobs d'ingestion exécutés en arrière-plan, un seul à la fois.
+
+        Les jobs soumis pendant qu'une ingestion tourne sont regroupés et traités
+        par une seule exécution suivante, puisque l'ingestion est incrémentale et
+        porte sur tout le dossier d'upload.
+
+        Args:
+            run_ingestion (callable): Fonction d'ingestion, appelée avec un callback
+                progress(filename, stage, **info) et retournant les statistiques
+            task_manager (TaskManager): Stockage du statut des jobs
+        """
+        self.run_ingestion = run_ingestion
+        self.task_manager = task_manager
+        self.lock = threading.Lock()
+        self.pending = []  # (job_id, fichiers) en attente de la prochaine exécution
+        self.running = False
+
+    def submit(self, job_id, filenames):
+        """Enregistre un job pour les fichiers uploadés et démarre le worker si nécessaire"""
+        self.task_manager.update_task_status(job_id, {
+            'status': 'queued',
+            'progress': 0,
+            'files': {filename: {'stage': 'queued'} for filename in filenames}
+        })
+        self.task_manager.keep_alive(job_id)
+        with self.lock:
+            self.pending.append((job_id, list(filenames)))
+            if not self.running:
+                self.running = True
+                threading.Thread(target=self._worker, daemon=True).start()
+        return job_id
+
+    def _worker(self):
+        while True:
+            with self.lock:
+                jobs, self.pending = self.pending, []
+                if not jobs:
+                    self.running = False
+                    return
+            self._run(jobs)
+
+    def _run(self, jobs):
+        job_files = {job_id: {filename: {'stage': 'queued'} for filename in filenames}
+                     for job_id, filenames in jobs}
+        run = {'total_files': 0, 'processed_files': 0}
+
+        for job_id in job_files:
+            self.task_manager.release(job_id)
+            self.task_manager.update_task_status(job_id, {'status': 'processing', 'coalesced_jobs': len(jobs)})
+
+        def progress(filename, stage, **info):
+            if stage == 'start':
+                run['total_files'] = info.get('total_files', 0)
+                return
+            if stage in ('done', 'skipped', 'error'):
+                run['processed_files'] += 1
+            percent = (run['processed_files'] / run['total_files'] * 100) if run['total_files'] else 0
+            for job_id, files in job_files.items():
+                if filename in files:
+                    files[filename] = {'stage': stage, **info}
+                self.task_manager.update_task_status(job_id, {
+                    'progress': percent,
+                    'processed_files': run['processed_files'],
+                    'total_files': run['total_files'],
+                    'files': dict(files)
+                })
+
+        try:
+            stats = self.run_ingestion(progress)
+            if stats is False:
+                raise RuntimeError("Erreur lors de l'indexation des documents")
+            for job_id in job_files:
+                self.task_manager.update_task_status(job_id, {
+                    'status': 'completed',
+                    'progress': 100,
+                    'stats': stats
+                })
+        except Exception as e:
+            logging.error(f"Erreur du job d'ingestion: {str(e)}")
+            for job_id in job_files:
+                self.task_manager.update_task_status(job_id, {
+                    'status': 'error',
+                    'error': str(e)
+                })
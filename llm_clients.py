@@ -0,0 +1,165 @@
+import os
+import time
+import random
+import hashlib
+import logging
+import weakref
+import threading
+from collections import OrderedDict
+from openai import OpenAI, AsyncOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient, Timeout, DEFAULT_CONNECTION_LIMITS
+from openai import RateLimitError, APITimeoutError, APIConnectionError, InternalServerError
+
+# Classes de configuration du client HTTP utilisé par le SDK (httpx, selon sa version)
+Limits = type(DEFAULT_CONNECTION_LIMITS)
+
+DEFAULT_TIMEOUT = Timeout(120.0, connect=10.0)  # read = attente maximale entre deux chunks du flux
+CONNECTION_LIMITS = Limits(max_connections=200, max_keepalive_connections=50, keepalive_expiry=90.0)
+IDLE_TTL = 15 * 60  # Un client inutilisé depuis IDLE_TTL secondes est retiré du registre
+MAX_CLIENTS = 256  # Au-delà, les clients les moins récemment utilisés sont retirés
+RETRYABLE_ERRORS = (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)
+
+
+class ClientRegistry:
+    def __init__(self, idle_ttl=IDLE_TTL, max_clients=MAX_CLIENTS, timeout=DEFAULT_TIMEOUT,
+                 limits=CONNECTION_LIMITS):
+        """
+        Registre de clients OpenAI (et compatibles) partagés par le process.
+
+        Un client, et son pool de connexions keep-alive, est créé par
+        (type, provider, base_url, hash de la clé API, options) puis réutilisé :
+        les requêtes suivantes ne refont ni handshake TLS ni connexion HTTP.
+        Un client retiré du registre (inactif ou LRU) n'est pas fermé de force :
+        son pool est fermé quand plus personne ne le référence.
+
+        Args:
+            idle_ttl (float): Durée d'inactivité avant retrait d'un client, en secondes
+            max_clients (int): Nombre maximal de clients gardés
+            timeout (Timeout): Timeout par défaut des requêtes
+            limits (Limits): Taille et durée de vie des pools de connexions
+        """
+        self.idle_ttl = idle_ttl
+        self.max_clients = max_clients
+        self.timeout = timeout
+        self.limits = limits
+        self.lock = threading.Lock()
+        self.clients = OrderedDict()  # clé -> [client, dernière utilisation]
+        self.created = 0
+        self.reused = 0
+        self.evicted = 0
+
+    @staticmethod
+    def key(async_client, provider, base_url, api_key, timeout, max_retries):
+        # La clé API n'est jamais gardée en clair dans le registre
+        key_hash = hashlib.sha256((api_key or "").encode('utf-8')).hexdigest()
+        return (async_client, provider, base_url, key_hash, timeout, max_retries)
+
+    def get(self, api_key=None, provider='openai', base_url=None, timeout=None, max_retries=None,
+            async_client=False):
+        """
+        Retourne le client partagé pour ces paramètres, en le créant si besoin.
+
+        Args:
+            api_key (str): Clé API (par défaut OPENAI_API_KEY)
+            provider (str): Provider, pour la clé du registre et les logs
+            base_url (str): URL de l'API (None = OpenAI)
+            timeout (float): Timeout des requêtes (défaut : DEFAULT_TIMEOUT)
+            max_retries (int): Retries du client (défaut : ceux du SDK)
+            async_client (bool): AsyncOpenAI au lieu d'OpenAI
+
+        Returns:
+            OpenAI | AsyncOpenAI: Client partagé
+        """
+        api_key = api_key or os.environ.get('OPENAI_API_KEY')
+        key = self.key(async_client, provider, base_url, api_key, timeout, max_retries)
+        now = time.monotonic()
+        with self.lock:
+            self._evict(now)
+            entry = self.clients.get(key)
+            if entry is None:
+                entry = [self._create(api_key, base_url, timeout, max_retries, async_client), now]
+                self.clients[key] = entry
+                self.created += 1
+                logging.info(f"Nouveau client LLM partagé: {provider} ({base_url or 'api.openai.com'})")
+            else:
+                self.reused += 1
+            entry[1] = now
+            self.clients.move_to_end(key)
+            return entry[0]
+
+    def _create(self, api_key, base_url, timeout, max_retries, async_client):
+        options = {'api_key': api_key, 'base_url': base_url}
+        if max_retries is not None:
+            options['max_retries'] = max_retries
+        http_timeout = self.timeout if timeout is None else Timeout(timeout, connect=self.timeout.connect)
+        if async_client:
+            http_client = DefaultAsyncHttpxClient(timeout=http_timeout, limits=self.limits)
+            return AsyncOpenAI(http_client=http_client, **options)
+        http_client = DefaultHttpxClient(timeout=http_timeout, limits=self.limits)
+        client = OpenAI(http_client=http_client, **options)
+        # Le pool fourni au SDK n'est pas fermé par lui : on le ferme avec le dernier utilisateur
+        weakref.finalize(client, http_client.close)
+        return client
+
+    def _evict(self, now):
+        while self.clients:
+            key, (_, last_used) = next(iter(self.clients.items()))
+            if len(self.clients) < self.max_clients and now - last_used <= self.idle_ttl:
+                break
+            del self.clients[key]
+            self.evicted += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                'clients': len(self.clients),
+                'created': self.created,
+                'reused': self.reused,
+                'evicted': self.evicted
+            }
+
+
+registry = ClientRegistry()
+
+
+def get_client(api_key=None, provider='openai', base_url=None, timeout=None, max_retries=None):
+    return registry.get(api_key, provider, base_url, timeout, max_retries)
+
+
+def get_async_client(api_key=None, provider='openai', base_url=None, timeout=None, max_retries=None):
+    return registry.get(api_key, provider, base_url, timeout, max_retries, async_client=True)
+
+
+def retry_delay(error, attempt, max_delay=60.0):
+    """Backoff exponentiel avec jitter, allongé au Retry-After renvoyé par l'API"""
+    delay = min(max_delay, 2 ** attempt) + random.uniform(0, 1)
+    response = getattr(error, 'response', None)
+    retry_after = response.headers.get('retry-after') if response is not None else None
+    if retry_after:
+        try:
+            delay = max(delay, float(retry_after))
+        except ValueError:
+            pass
+    return delay
+
+
+def call_with_backoff(call, max_retries, label="Appel API"):
+    """
+    Exécute call() en réessayant sur 429 et erreurs transitoires (RETRYABLE_ERRORS).
+
+    Args:
+        call (callable): Appel à l'API, rejoué tel quel à chaque tentative
+        max_retries (int): Nombre maximal de nouvelles tentatives
+        label (str): Description de l'appel pour les logs
+
+    Returns:
+        Le résultat de call()
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return call()
+        except RETRYABLE_ERRORS as e:
+            if attempt == max_retries:
+                raise
+            delay = retry_delay(e, attempt)
+            logging.warning(f"{label} limité ({type(e).__name__}), nouvel essai dans {delay:.1f}s")
+            time.sleep(delay)
@@ -1,19 +1,89 @@
+import os
+import time
+import array
+import sqlite3
+import hashlib
 import logging
-from openai import OpenAI
+import threading
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from llm_clients import get_client, call_with_backoff
 
 class OpenAIEmbeddingsWrapper:
-    def __init__(self, model="text-embedding-3-small"):
-        self.client = OpenAI()
+    MAX_BATCH_INPUTS = 2048  # Limite d'entrées par requête de l'API embeddings
+    MAX_BATCH_TOKENS = 250000  # Marge sous la limite de 300k tokens par requête
+
+    def __init__(self, model="text-embedding-3-small", max_workers=4, max_retries=6,
+                 batch_tokens=MAX_BATCH_TOKENS, batch_inputs=MAX_BATCH_INPUTS):
+        """
+        Args:
+            model (str): Modèle d'embedding OpenAI
+            max_workers (int): Nombre maximal de requêtes d'embedding simultanées
+            max_retries (int): Nombre de nouvelles tentatives sur 429 / erreurs transitoires
+            batch_tokens (int): Budget de tokens par requête
+            batch_inputs (int): Nombre maximal de textes par requête
+        """
+        self.client = get_client(max_retries=0)  # Les retries sont gérés ici, avec backoff
         self.model = model
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.batch_tokens = batch_tokens
+        self.batch_inputs = batch_inputs
+        self._encoding = None
+
+    def _count_tokens(self, text):
+        if self._encoding is None:
+            try:
+                import tiktoken
+                try:
+                    self._encoding = tiktoken.encoding_for_model(self.model)
+                except KeyError:
+                    self._encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                logging.warning(f"tiktoken indisponible, estimation du nombre de tokens: {str(e)}")
+                self._encoding = False
+        if self._encoding is False:
+            return len(text) // 3 + 1
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+    def _batches(self, texts):
+        """Découpe les textes en lots respectant le budget de tokens et d'entrées par requête"""
+        batch_start, batch_tokens = 0, 0
+        for i, text in enumerate(texts):
+            tokens = self._count_tokens(text)
+            if i > batch_start and (batch_tokens + tokens > self.batch_tokens
+                                    or i - batch_start >= self.batch_inputs):
+                yield batch_start, texts[batch_start:i]
+                batch_start, batch_tokens = i, 0
+            batch_tokens += tokens
+        if batch_start < len(texts):
+            yield batch_start, texts[batch_start:]
+
+    def _create(self, texts):
+        """Appel embeddings.create avec backoff exponentiel sur 429 et erreurs transitoires"""
+        return call_with_backoff(
+            lambda: self.client.embeddings.create(input=texts, model=self.model),
+            self.max_retries, "Embedding OpenAI"
+        )
 
     def embed_documents(self, texts):
-        """Embed a list of texts."""
+        """Embed a list of texts, par lots en parallèle, en conservant l'ordre."""
         try:
-            response = self.client.embeddings.create(
-                input=texts,
-                model=self.model
-            )
-            return [data.embedding for data in response.data]
+            texts = list(texts)
+            batches = list(self._batches(texts))
+            if len(batches) <= 1:
+                return [data.embedding for batch in batches for data in self._create(batch[1]).data]
+
+            logging.info(f"Embedding de {len(texts)} textes en {len(batches)} lots")
+            embeddings = [None] * len(texts)
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = {executor.submit(self._create, batch): start for start, batch in batches}
+                for future in as_completed(futures):
+                    start = futures[future]
+                    for offset, data in enumerate(future.result().data):
+                        embeddings[start + offset] = data.embedding
+            return embeddings
         except Exception as e:
             logging.error(f"Erreur lors de l'embedding OpenAI: {str(e)}")
             raise e
@@ -21,11 +91,139 @@ class OpenAIEmbeddingsWrapper:
     def embed_query(self, text):
         """Embed a single text."""
         try:
-            response = self.client.embeddings.create(
-                input=text,
-                model=self.model
-            )
+            response = self._create(text)
             return response.data[0].embedding
         except Exception as e:
             logging.error(f"Erreur lors de l'embedding OpenAI: {str(e)}")
-            raise e
\ No newline at end of file
+            raise e
+
+
+class EmbeddingCache:
+    def __init__(self, max_entries=2048, ttl=24 * 3600, disk_path=None):
+        """
+        Cache d'embeddings à deux niveaux : LRU en mémoire borné, et optionnellement
+        une table SQLite sur disque qui survit aux redémarrages.
+
+        Args:
+            max_entries (int): Nombre maximal d'entrées en mémoire
+            ttl (float): Durée de validité d'une entrée en secondes (None = illimitée)
+            disk_path (str): Chemin de la base SQLite (None = pas de niveau disque)
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self.disk_path = disk_path
+        self.db = None  # Ouverte au premier accès, pas à l'import
+
+    def _disk(self):
+        """Base SQLite du niveau disque, ouverte au premier accès (à appeler sous self.lock)"""
+        if self.db is None and self.disk_path:
+            os.makedirs(os.path.dirname(self.disk_path) or '.', exist_ok=True)
+            db = sqlite3.connect(self.disk_path, check_same_thread=False)
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, embedding BLOB, created REAL)"
+            )
+            if self.ttl is not None:
+                # Purge des entrées expirées laissées par les exécutions précédentes
+                db.execute("DELETE FROM embeddings WHERE created < ?", (time.time() - self.ttl,))
+            db.commit()
+            self.db = db
+        return self.db
+
+    @staticmethod
+    def normalize(text):
+        """Normalise le texte (unicode NFC, espaces) pour que les variantes triviales partagent une entrée"""
+        return " ".join(unicodedata.normalize("NFC", text).split())
+
+    def key(self, model, text):
+        return hashlib.sha256(f"{model}\0{self.normalize(text)}".encode('utf-8')).hexdigest()
+
+    def _expired(self, created):
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def get(self, model, text):
+        key = self.key(model, text)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                embedding, created = entry
+                if not self._expired(created):
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return embedding
+                del self.entries[key]
+
+            db = self._disk()
+            if db is not None:
+                row = db.execute(
+                    "SELECT embedding, created FROM embeddings WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and not self._expired(row[1]):
+                    embedding = array.array('f', row[0]).tolist()
+                    self._remember(key, embedding, row[1])
+                    self.disk_hits += 1
+                    return embedding
+
+            self.misses += 1
+            return None
+
+    def set(self, model, text, embedding):
+        key = self.key(model, text)
+        created = time.time()
+        with self.lock:
+            self._remember(key, list(embedding), created)
+            db = self._disk()
+            if db is not None:
+                db.execute(
+                    "INSERT OR REPLACE INTO embeddings (key, embedding, created) VALUES (?, ?, ?)",
+                    (key, array.array('f', embedding).tobytes(), created)
+                )
+                db.commit()
+
+    def _remember(self, key, embedding, created):
+        self.entries[key] = (embedding, created)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses
+            }
+
+
+class CachedEmbeddings:
+    def __init__(self, embeddings, model, cache):
+        """
+        Ajoute le cache d'embeddings de requêtes à n'importe quel provider
+        (OpenAIEmbeddingsWrapper, HuggingFaceEmbeddings...).
+
+        Args:
+            embeddings: Objet exposant embed_documents / embed_query
+            model (str): Nom du modèle, inclus dans la clé de cache
+            cache (EmbeddingCache): Cache partagé
+        """
+        self.embeddings = embeddings
+        self.model = model
+        self.cache = cache
+
+    def embed_documents(self, texts):
+        """Embed a list of texts (non caché : l'ingestion est déjà dédupliquée par le manifeste)."""
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        """Embed a single text, en passant par le cache."""
+        embedding = self.cache.get(self.model, text)
+        if embedding is None:
+            embedding = self.embeddings.embed_query(text)
+            self.cache.set(self.model, text, embedding)
+        return embedding
@@ -0,0 +1,196 @@
+import logging
+
+# Fenêtre de contexte (en tokens) par modèle
+MODEL_CONTEXT_WINDOWS = {
+    'gpt-4o': 128000,
+    'deepseek-chat': 64000,
+}
+DEFAULT_CONTEXT_WINDOW = 16000
+MESSAGE_OVERHEAD_TOKENS = 4  # Tokens de structure ajoutés par message dans le format chat
+MAX_OVERLAP_CHARS = 2000  # Recherche du recouvrement entre chunks voisins limitée à ces caractères
+
+_encodings = {}
+
+
+def count_tokens(text, model):
+    """Compte les tokens avec tiktoken, ou les estime si l'encodage n'est pas disponible"""
+    if model not in _encodings:
+        try:
+            import tiktoken
+            try:
+                _encodings[model] = tiktoken.encoding_for_model(model)
+            except KeyError:
+                _encodings[model] = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            logging.warning(f"tiktoken indisponible, estimation du nombre de tokens: {str(e)}")
+            _encodings[model] = None
+    encoding = _encodings[model]
+    if encoding is None:
+        return len(text) // 3 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def _chunk_position(doc):
+    """(préfixe du document, index du chunk) d'après l'ID déterministe 'préfixe-index'"""
+    prefix, _, index = (doc.id or "").rpartition('-')
+    return (prefix, int(index)) if prefix and index.isdigit() else (None, None)
+
+
+def _merge_overlap(first, second):
+    """Concatène deux chunks consécutifs en retirant le recouvrement (OVERLAP_SIZE) entre eux"""
+    for length in range(min(len(first), len(second), MAX_OVERLAP_CHARS), 0, -1):
+        if first.endswith(second[:length]):
+            return first + second[length:]
+    return first + "\n" + second
+
+
+def merge_chunks(docs):
+    """
+    Dédoublonne les chunks et fusionne les chunks voisins d'un même document.
+
+    Les chunks consécutifs (index n et n+1 du même document) se recouvrent de
+    OVERLAP_SIZE tokens : ils sont fusionnés en un seul bloc sans répétition.
+    Les blocs gardent l'ordre de pertinence de leur meilleur chunk.
+
+    Returns:
+        list: Blocs {'source', 'pages', 'content'}
+    """
+    seen = set()
+    groups = {}  # préfixe -> {index: doc}
+    order = []  # (rang, préfixe ou doc isolé)
+    for rank, doc in enumerate(docs):
+        key = doc.id or doc.page_content
+        if key in seen:
+            continue
+        seen.add(key)
+        prefix, index = _chunk_position(doc)
+        if prefix is None:
+            order.append((rank, doc))
+            continue
+        if prefix not in groups:
+            groups[prefix] = {}
+            order.append((rank, prefix))
+        groups[prefix][index] = doc
+
+    blocks = []
+    for _, item in order:
+        if not isinstance(item, str):
+            blocks.append(_block([item], item.page_content))
+            continue
+        chunks = groups[item]
+        run = []
+        for index in sorted(chunks):
+            if run and index != _chunk_position(run[-1])[1] + 1:
+                blocks.append(_block(run, _merge_run(run)))
+                run = []
+            run.append(chunks[index])
+        blocks.append(_block(run, _merge_run(run)))
+    return blocks
+
+
+def _merge_run(run):
+    content = run[0].page_content
+    for doc in run[1:]:
+        content = _merge_overlap(content, doc.page_content)
+    return content
+
+
+def _block(docs, content):
+    pages = sorted({doc.metadata['page'] for doc in docs if doc.metadata.get('page') is not None})
+    return {'source': docs[0].metadata.get('source'), 'pages': pages, 'content': content}
+
+
+def format_block(block):
+    """Bloc de contexte précédé de sa référence (source, page) pour les citations"""
+    reference = f"source: {block['source']}"
+    if block['pages']:
+        pages = block['pages']
+        reference += f", page: {pages[0]}" if len(pages) == 1 else f", page: {pages[0]}-{pages[-1]}"
+    return f"({reference})\n{block['content']}"
+
+
+class PromptBuilder:
+    def __init__(self, model, max_output_tokens=4096, context_share=0.6):
+        """
+        Assemble les messages envoyés au LLM dans le budget de tokens du modèle.
+
+        Args:
+            model (str): Modèle cible (détermine la fenêtre de contexte et l'encodage)
+            max_output_tokens (int): Tokens réservés à la réponse
+            context_share (float): Part maximale du budget d'entrée réservée au contexte RAG
+        """
+        self.model = model
+        self.max_output_tokens = max_output_tokens
+        self.context_share = context_share
+        self.input_budget = MODEL_CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW) - max_output_tokens
+
+    def count(self, text):
+        return count_tokens(text, self.model) + MESSAGE_OVERHEAD_TOKENS
+
+    def build(self, system_prompt, history, docs, message, context_intro=""):
+        """
+        Construit la liste de messages : système, historique récent, contexte, question.
+
+        Le contexte est dédoublonné et fusionné, puis tronqué au budget de contexte ;
+        l'historique est rempli en partant des tours les plus récents avec le budget restant.
+
+        Returns:
+            tuple: (messages, comptes de tokens du prompt final)
+        """
+        # Le client renvoie la question courante en fin d'historique : on ne la compte qu'une fois
+        history = list(history or [])
+        if history and history[-1].get('role') == 'user' and history[-1].get('content') == message:
+            history.pop()
+
+        system_tokens = self.count(system_prompt)
+        message_tokens = self.count(message)
+        remaining = self.input_budget - system_tokens - message_tokens
+
+        blocks = merge_chunks(docs)
+        context_budget = min(remaining, int(self.input_budget * self.context_share))
+        context_parts = []
+        context_tokens = self.count(context_intro) if blocks else 0
+        for block in blocks:
+            text = format_block(block)
+            tokens = count_tokens(text, self.model) + 2
+            if context_tokens + tokens > context_budget:
+                break
+            context_parts.append(text)
+            context_tokens += tokens
+        context = "\n\n".join(context_parts)
+        if not context:
+            context_tokens = 0
+        remaining -= context_tokens
+
+        kept_history = []
+        history_tokens = 0
+        for turn in reversed(history):
+            tokens = self.count(str(turn.get('content', '')))
+            if history_tokens + tokens > remaining:
+                break
+            kept_history.append({'role': turn.get('role'), 'content': turn.get('content')})
+            history_tokens += tokens
+        # Pas de réponse orpheline en tête : l'historique gardé commence par une question
+        while kept_history and kept_history[-1]['role'] == 'assistant':
+            history_tokens -= self.count(str(kept_history.pop()['content']))
+        kept_history.reverse()
+
+        messages = [{"role": "system", "content": system_prompt}]
+        messages.extend(kept_history)
+        if context:
+            messages.append({"role": "assistant", "content": context_intro + context})
+        messages.append({"role": "user", "content": message})
+
+        token_counts = {
+            'system': system_tokens,
+            'history': history_tokens,
+            'history_turns': len(kept_history),
+            'history_turns_dropped': len(history) - len(kept_history),
+            'context': context_tokens,
+            'context_chunks': len(docs),
+            'context_blocks': len(context_parts),
+            'message': message_tokens,
+            'total': system_tokens + history_tokens + context_tokens + message_tokens,
+            'budget': self.input_budget
+        }
+        return messages, token_counts
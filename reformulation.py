@@ -0,0 +1,144 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+# Stratégies de reformulation de la question avant la recherche :
+# - off      : recherche directe sur la question originale
+# - always   : reformulation bloquante par le LLM avant chaque recherche
+# - cache    : comme always, mais les reformulations déjà faites sont réutilisées
+# - parallel : recherche sur la question originale pendant la reformulation,
+#              puis fusion des résultats si la reformulation arrive à temps
+STRATEGIES = ('off', 'always', 'cache', 'parallel')
+
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='reformulation')
+
+
+class ReformulationCache:
+    def __init__(self, max_entries=1024, ttl=24 * 3600):
+        """
+        Cache LRU des reformulations, indexé par (provider, question normalisée).
+
+        Args:
+            max_entries (int): Nombre maximal de reformulations gardées
+            ttl (float): Durée de validité d'une entrée en secondes
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(text):
+        return " ".join(text.casefold().split())
+
+    def get(self, provider, message):
+        key = (provider, self.normalize(message))
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.time() - entry[1] <= self.ttl:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.entries.pop(key, None)
+            self.misses += 1
+            return None
+
+    def set(self, provider, message, reformulated):
+        key = (provider, self.normalize(message))
+        with self.lock:
+            self.entries[key] = (reformulated, time.time())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'hits': self.hits, 'misses': self.misses}
+
+
+def merge_results(primary, secondary, k):
+    """Fusionne deux listes de documents en les alternant, sans doublons, limitées à k"""
+    merged = []
+    seen = set()
+    for i in range(max(len(primary), len(secondary))):
+        for docs in (primary, secondary):
+            if i < len(docs):
+                doc = docs[i]
+                key = getattr(doc, 'id', None) or doc.page_content
+                if key not in seen:
+                    seen.add(key)
+                    merged.append(doc)
+    return merged[:k]
+
+
+def retrieve_with_reformulation(strategy, message, k, retrieve, reformulate, cache, provider, timeout):
+    """
+    Recherche les documents pertinents selon la stratégie de reformulation choisie.
+
+    Args:
+        strategy (str): Une des STRATEGIES
+        message (str): Question de l'utilisateur
+        k (int): Nombre de documents voulus
+        retrieve (callable): retrieve(query) -> liste de documents
+        reformulate (callable): reformulate(message) -> question reformulée
+        cache (ReformulationCache): Cache des reformulations
+        provider (str): Provider LLM, inclus dans la clé de cache
+        timeout (float): Mode parallel, attente maximale de la reformulation en secondes
+
+    Returns:
+        tuple: (documents, question utilisée, mesures de latence en ms)
+    """
+    start = time.perf_counter()
+    timings = {'strategy': strategy}
+
+    def elapsed_ms(since):
+        return round((time.perf_counter() - since) * 1000, 1)
+
+    def reformulate_and_cache():
+        reformulated = reformulate(message)
+        if reformulated and reformulated != message:
+            cache.set(provider, message, reformulated)
+        return reformulated or message
+
+    cached = cache.get(provider, message) if strategy in ('cache', 'parallel') else None
+
+    if strategy == 'off':
+        query = message
+    elif cached is not None:
+        query = cached
+        timings['reformulation_cache'] = 'hit'
+    elif strategy == 'parallel':
+        future = _executor.submit(reformulate_and_cache)
+        retrieval_start = time.perf_counter()
+        docs = retrieve(message)
+        timings['retrieval_ms'] = elapsed_ms(retrieval_start)
+        try:
+            reformulated = future.result(timeout=max(0.0, timeout - (time.perf_counter() - start)))
+        except FutureTimeoutError:
+            # La reformulation continue en arrière-plan et alimentera le cache
+            logging.info("Reformulation trop lente, utilisation des résultats de la question originale")
+            timings['reformulation'] = 'timeout'
+            timings['total_ms'] = elapsed_ms(start)
+            return docs, message, timings
+        timings['reformulation_ms'] = elapsed_ms(start)
+        if reformulated != message:
+            retrieval_start = time.perf_counter()
+            docs = merge_results(retrieve(reformulated), docs, k)
+            timings['retrieval_ms'] = round(timings['retrieval_ms'] + elapsed_ms(retrieval_start), 1)
+        timings['total_ms'] = elapsed_ms(start)
+        return docs, reformulated, timings
+    else:
+        # always, ou cache sans entrée : reformulation bloquante
+        reformulation_start = time.perf_counter()
+        query = reformulate_and_cache() if strategy == 'cache' else (reformulate(message) or message)
+        timings['reformulation_ms'] = elapsed_ms(reformulation_start)
+
+    retrieval_start = time.perf_counter()
+    docs = retrieve(query)
+    timings['retrieval_ms'] = elapsed_ms(retrieval_start)
+    timings['total_ms'] = elapsed_ms(start)
+    return docs, query, timings
@@ -0,0 +1,113 @@
+import time
+import logging
+import threading
+import numpy as np
+
+# Stratégies de reranking des candidats avant l'assemblage du prompt :
+# - off           : les k premiers résultats de la recherche, sans reranking
+# - mmr           : maximal marginal relevance sur les embeddings stockés (diversité)
+# - cross_encoder : cross-encoder local (CPU) qui note chaque paire (question, chunk)
+STRATEGIES = ('off', 'mmr', 'cross_encoder')
+
+_cross_encoders = {}
+_cross_encoder_lock = threading.Lock()
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def mmr_select(query_embedding, embeddings, k, lambda_mult=0.5):
+    """
+    Sélection gloutonne par maximal marginal relevance.
+
+    Args:
+        query_embedding (list): Embedding de la question
+        embeddings (list): Embeddings des candidats
+        k (int): Nombre de candidats à garder
+        lambda_mult (float): 1 = pertinence seule, 0 = diversité seule
+
+    Returns:
+        list: Indices des candidats retenus, dans l'ordre de sélection
+    """
+    if not embeddings:
+        return []
+    candidates = _normalize(np.asarray(embeddings, dtype=np.float32))
+    query = _normalize(np.asarray(query_embedding, dtype=np.float32))
+    relevance = candidates @ query
+    similarity = candidates @ candidates.T
+
+    selected = [int(np.argmax(relevance))]
+    redundancy = similarity[selected[0]].copy()
+    while len(selected) < min(k, len(candidates)):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[selected] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        redundancy = np.maximum(redundancy, similarity[best])
+    return selected
+
+
+def get_cross_encoder(model_name):
+    """Cross-encoder partagé par le process, chargé sur CPU à la première utilisation"""
+    with _cross_encoder_lock:
+        if model_name not in _cross_encoders:
+            from sentence_transformers import CrossEncoder
+            logging.info(f"Chargement du cross-encoder {model_name}")
+            _cross_encoders[model_name] = CrossEncoder(model_name, device='cpu')
+        return _cross_encoders[model_name]
+
+
+def cross_encoder_scores(model_name, query, texts, batch_size=32):
+    model = get_cross_encoder(model_name)
+    # Un seul predict à la fois : le modèle occupe déjà tous les cœurs CPU
+    with _cross_encoder_lock:
+        return model.predict([(query, text) for text in texts], batch_size=batch_size,
+                             show_progress_bar=False)
+
+
+def rerank(strategy, query, docs, k, embed_query, fetch_embeddings, mmr_lambda=0.5,
+           model_name=None, batch_size=32):
+    """
+    Réordonne un pool de candidats et en garde k.
+
+    Args:
+        strategy (str): Une des STRATEGIES
+        query (str): Question utilisée pour la recherche
+        docs (list): Candidats, par pertinence décroissante
+        k (int): Nombre de documents voulus
+        embed_query (callable): embed_query(texte) -> embedding
+        fetch_embeddings (callable): fetch_embeddings(ids) -> {id: embedding} (embeddings stockés)
+        mmr_lambda (float): Compromis pertinence / diversité du MMR
+        model_name (str): Modèle du cross-encoder
+        batch_size (int): Paires notées par lot par le cross-encoder
+
+    Returns:
+        tuple: (documents retenus, mesures du reranking)
+    """
+    start = time.perf_counter()
+    timings = {'strategy': strategy, 'candidates': len(docs)}
+    if strategy == 'off' or len(docs) <= 1:
+        return docs[:k], timings
+
+    try:
+        if strategy == 'mmr':
+            stored = fetch_embeddings([doc.id for doc in docs if doc.id])
+            with_embedding = [doc for doc in docs if doc.id in stored]
+            selected = mmr_select(embed_query(query), [stored[doc.id] for doc in with_embedding],
+                                  k, mmr_lambda)
+            reranked = [with_embedding[i] for i in selected]
+            # Candidats sans embedding stocké : gardés après la sélection, dans leur ordre
+            reranked += [doc for doc in docs if doc.id not in stored][:k - len(reranked)]
+        else:
+            scores = cross_encoder_scores(model_name, query, [doc.page_content for doc in docs], batch_size)
+            reranked = [docs[i] for i in np.argsort(-np.asarray(scores), kind='stable')[:k]]
+    except Exception as e:
+        logging.warning(f"Reranking {strategy} impossible, ordre de la recherche conservé: {str(e)}")
+        timings['error'] = str(e)
+        reranked = docs[:k]
+
+    timings['rerank_ms'] = round((time.perf_counter() - start) * 1000, 1)
+    return reranked, timings
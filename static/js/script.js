@@ -90,7 +90,16 @@ async function uploadFiles(files) {
         
         if (!response.ok) throw await response.json();
 
-        showStatusMessage('Fichiers transférés avec succès', 'success');
+        const data = await response.json();
+        showStatusMessage('Fichiers transférés, indexation en cours...', 'success');
+
+        // L'indexation tourne côté serveur : on suit sa progression
+        const status = await waitForIngestion(data.job_id, status => {
+            DOM.fileStatus.textContent = `Indexation: ${Math.round(status.progress || 0)}%`;
+        });
+        if (status.status === 'error') throw {error: status.error};
+
+        showStatusMessage('Fichiers indexés avec succès', 'success');
         DOM.fileStatus.textContent += ' ✓';
     } catch (error) {
         showStatusMessage(`Erreur: ${error.error || 'Échec du transfert'}`, 'error');
@@ -100,6 +109,20 @@ async function uploadFiles(files) {
     }
 }
 
+async function waitForIngestion(jobId, onProgress) {
+    while (true) {
+        const response = await fetch(`/upload/status/${jobId}`);
+        const status = await response.json();
+        onProgress(status);
+
+        if (status.status === 'completed' || status.status === 'error') {
+            return status;
+        }
+
+        await new Promise(resolve => setTimeout(resolve, 1000));
+    }
+}
+
 // Chat Handling
 let currentMessageContent = null;
 let currentMessageDiv = null;
@@ -121,6 +144,8 @@ async function sendMessage() {
         const apiKey = getCookie('api_key');
         const provider = getCookie('api_provider');
         const nbResults = getCookie('nb_results') || '5';
+        const reformulation = getCookie('reformulation');
+        const rerank = getCookie('rerank');
         if (!apiKey) throw new Error('API key missing');
 
         // Création du body de la requête
@@ -129,6 +154,8 @@ async function sendMessage() {
             api_key: apiKey,
             provider: provider,
             nb_results: nbResults,
+            reformulation: reformulation || undefined,
+            rerank: rerank || undefined,
             history: chatHistory  // Pas besoin de JSON.stringify ici
         };
 
@@ -285,7 +312,7 @@ function finalizeBotMessage(content, sources) {
                 ${sources.map(s => `
                     <div class="source-item">
                         <i class="fas fa-file-alt"></i>
-                        <span>${s.source} - ${s.content}</span>
+                        <span>${s.source}${s.page ? ` (p. ${s.page})` : ''} - ${s.content}</span>
                     </div>
                 `).join('')}
             </details>
@@ -312,6 +339,8 @@ function setApiKey() {
     const apiKey = document.getElementById('apiKey').value.trim();
     const provider = document.getElementById('apiProvider').value;
     const nbResults = document.getElementById('nbResults').value;
+    const reformulation = document.getElementById('reformulation').value;
+    const rerank = document.getElementById('rerank').value;
     
     const validation = validateApiKey(apiKey);
     
@@ -323,6 +352,8 @@ function setApiKey() {
     setCookie('api_key', apiKey, 30);
     setCookie('api_provider', provider, 30);
     setCookie('nb_results', nbResults, 30);
+    setCookie('reformulation', reformulation, 30);
+    setCookie('rerank', rerank, 30);
     
     toggleSettings();
     showStatusMessage('Configuration API sauvegardée', 'success');
@@ -332,6 +363,8 @@ function loadApiSettings() {
     const apiKey = getCookie('api_key');
     const provider = getCookie('api_provider');
     const nbResults = getCookie('nb_results');
+    const reformulation = getCookie('reformulation');
+    const rerank = getCookie('rerank');
     
     if (apiKey) {
         document.getElementById('apiKey').value = apiKey;
@@ -345,6 +378,14 @@ function loadApiSettings() {
     if (nbResults) {
         document.getElementById('nbResults').value = nbResults;
     }
+
+    if (reformulation) {
+        document.getElementById('reformulation').value = reformulation;
+    }
+
+    if (rerank) {
+        document.getElementById('rerank').value = rerank;
+    }
 }
 
 function togglePasswordVisibility() {
@@ -205,6 +205,13 @@ class FileManager {
                 if (!response.ok) {
                     throw new Error('Erreur lors de l\'upload');
                 }
+
+                // Attendre la fin de l'indexation en arrière-plan
+                const data = await response.json();
+                const status = await this.waitForIngestion(data.job_id);
+                if (status.status === 'error') {
+                    throw new Error(status.error);
+                }
             } catch (error) {
                 console.error('Erreur:', error.message);
             }
@@ -214,6 +221,19 @@ class FileManager {
         await this.loadFiles(); // Recharger tous les fichiers après les uploads
     }
 
+    async waitForIngestion(jobId) {
+        while (true) {
+            const response = await fetch(`/upload/status/${jobId}`);
+            const status = await response.json();
+
+            if (status.status === 'completed' || status.status === 'error') {
+                return status;
+            }
+
+            await new Promise(resolve => setTimeout(resolve, 1000));
+        }
+    }
+
     getCookie(name) {
         return document.cookie.split('; ')
             .find(row => row.startsWith(`${name}=`))
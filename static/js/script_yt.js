@@ -66,7 +66,8 @@ async function downloadVideo(url) {
         body: JSON.stringify({
             url,
             api_key: apiKey,
-            provider: provider
+            provider: provider,
+            index_to_rag: document.getElementById('indexToRag').checked
         })
     });
     
@@ -79,6 +80,50 @@ async function downloadVideo(url) {
     }
 }
 
+async function bulkTranscribe() {
+    const url = document.getElementById('searchInput').value.trim();
+    const apiKey = getCookie('api_key');
+    const provider = getCookie('api_provider');
+
+    if (!url) {
+        alert('Collez le lien d\'une playlist ou d\'une chaîne');
+        return;
+    }
+    if (!apiKey) {
+        alert('Veuillez configurer votre clé API dans les paramètres');
+        return;
+    }
+
+    const response = await fetch('/youtube/bulk', {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({
+            url,
+            api_key: apiKey,
+            provider: provider,
+            index_to_rag: document.getElementById('indexToRag').checked
+        })
+    });
+
+    const data = await response.json();
+    if (data.success) {
+        createDownloadItem(data.task_id);
+        monitorDownload(data.task_id);
+    } else {
+        alert(data.error || 'Erreur lors de la transcription du lot');
+    }
+}
+
+function bulkSummary(status) {
+    const stats = status.stats || {};
+    const done = (stats.transcribed || 0) + (stats.skipped || 0);
+    let text = `${done}/${stats.total || 0} vidéos`;
+    if (stats.skipped) text += `, ${stats.skipped} déjà transcrites`;
+    if (stats.failed) text += `, ${stats.failed} en erreur`;
+    if (status.videos_per_minute) text += ` - ${status.videos_per_minute} vidéos/min`;
+    return text;
+}
+
 function createDownloadItem(taskId) {
     const div = document.createElement('div');
     div.id = `download-${taskId}`;
@@ -99,16 +144,44 @@ function createDownloadItem(taskId) {
     setTimeout(() => div.style.opacity = '1', 10);
 }
 
-async function monitorDownload(taskId) {
+function isFinished(status) {
+    return status.status === 'completed' || status.status === 'error';
+}
+
+function monitorDownload(taskId) {
     activeDownloads.set(taskId, true);
-    
+
+    if (!window.EventSource) {
+        pollDownload(taskId);
+        return;
+    }
+
+    // Le serveur pousse chaque changement de statut ; en cas d'échec du flux, on repasse en polling
+    const source = new EventSource(`/youtube/status/${taskId}/stream`);
+    source.onmessage = (event) => {
+        const status = JSON.parse(event.data);
+        updateDownloadStatus(taskId, status);
+        if (isFinished(status)) {
+            source.close();
+            activeDownloads.delete(taskId);
+        }
+    };
+    source.onerror = () => {
+        source.close();
+        if (activeDownloads.get(taskId)) {
+            pollDownload(taskId);
+        }
+    };
+}
+
+async function pollDownload(taskId) {
     while (activeDownloads.get(taskId)) {
         const response = await fetch(`/youtube/status/${taskId}`);
         const status = await response.json();
         
         updateDownloadStatus(taskId, status);
         
-        if (status.status === 'completed' || status.status === 'error') {
+        if (isFinished(status)) {
             activeDownloads.delete(taskId);
             break;
         }
@@ -130,7 +203,27 @@ function updateDownloadStatus(taskId, status) {
         progressBar.style.width = `${status.progress}%`;
     }
 
+    if (status.bulk) {
+        if (status.status === 'processing') {
+            statusText.textContent = status.stage === 'expanding' ?
+                'Lecture de la playlist...' : `Lot: ${bulkSummary(status)}`;
+            icon.className = 'fas fa-list';
+            return;
+        }
+        if (status.status === 'completed') {
+            progressBar.style.width = '100%';
+            statusText.textContent = `Lot terminé: ${bulkSummary(status)}`;
+            icon.className = 'fas fa-check-circle';
+            return;
+        }
+    }
+
     switch (status.status) {
+        case 'queued':
+            statusText.textContent = 'En attente...';
+            icon.className = 'fas fa-clock';
+            break;
+
         case 'starting':
             statusText.textContent = 'Démarrage...';
             icon.className = 'fas fa-sync fa-spin';
@@ -144,13 +237,19 @@ function updateDownloadStatus(taskId, status) {
         case 'transcribing':
             let segmentInfo = status.current_segment ? 
                 ` (${status.current_segment}/${status.total_segments})` : '';
-            statusText.textContent = `Transcription: ${Math.round(status.progress)}%${segmentInfo}`;
+            let indexInfo = status.indexed_chunks ? `, ${status.indexed_chunks} chunks indexés` : '';
+            statusText.textContent = `Transcription: ${Math.round(status.progress)}%${segmentInfo}${indexInfo}`;
             icon.className = 'fas fa-closed-captioning';
             break;
             
         case 'completed':
             progressBar.style.width = '100%';
-            statusText.textContent = 'Transcription terminée';
+            if (status.index_error) {
+                statusText.textContent = `Transcription terminée, indexation en échec: ${status.index_error}`;
+            } else {
+                statusText.textContent = status.indexed_chunks ?
+                    `Transcription terminée, indexée (${status.indexed_chunks} chunks)` : 'Transcription terminée';
+            }
             icon.className = 'fas fa-check-circle';
             
             const transcriptDiv = document.createElement('div');
@@ -0,0 +1,276 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+TASKS_DB_PATH = 'cache/tasks.sqlite3'
+TASK_TTL = 24 * 3600  # Les tâches non mises à jour depuis TASK_TTL secondes sont supprimées
+STALE_AFTER = 30 * 60  # Une tâche active sans nouvelle depuis ce délai est considérée interrompue
+CLEANUP_INTERVAL = 300  # Nettoyage au plus une fois par intervalle (en secondes)
+POLL_INTERVAL = 1.0  # Relecture de la base pendant une attente, pour les mises à jour d'autres process
+HEARTBEAT_INTERVAL = 5 * 60  # Rafraîchissement des tâches en file d'attente (doit rester < STALE_AFTER)
+ACTIVE_STATUSES = ('queued', 'starting', 'downloading', 'transcribing', 'processing')
+FINAL_STATUSES = ('completed', 'error')
+
+
+class QueueFullError(RuntimeError):
+    pass
+
+
+class TaskManager:
+    def __init__(self, db_path=TASKS_DB_PATH, ttl=TASK_TTL):
+        """
+        Statut des tâches en arrière-plan, persisté dans SQLite.
+
+        Le stockage est partagé par tous les workers (n'importe lequel peut répondre
+        à une requête de statut) et survit aux redémarrages. Les tâches expirées
+        sont supprimées, celles interrompues par un arrêt du process passent en erreur.
+
+        Args:
+            db_path (str): Chemin de la base SQLite
+            ttl (float): Durée de conservation d'une tâche après sa dernière mise à jour
+        """
+        self.db_path = db_path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.changed = threading.Condition()  # Réveille les flux de progression de ce process
+        self.last_cleanup = 0.0
+        self.waiting_lock = threading.Lock()
+        self.waiting = set()  # Tâches en file d'attente dans ce process
+        self.heartbeat = None
+        self.ready = False
+
+    def _connect(self):
+        """
+        Connexion courte à la base. Le schéma est créé à la première utilisation,
+        pas à la construction : importer le module (y compris depuis un worker
+        multiprocessing) n'ouvre pas la base. Le premier nettoyage suit la première
+        consultation ou mise à jour de statut (last_cleanup vaut 0).
+        """
+        if not self.ready:
+            os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript("""
+                    CREATE TABLE IF NOT EXISTS tasks (
+                        task_id TEXT PRIMARY KEY,
+                        status TEXT,
+                        dedupe_key TEXT,
+                        data TEXT NOT NULL,
+                        created REAL NOT NULL,
+                        updated REAL NOT NULL
+                    );
+                    CREATE INDEX IF NOT EXISTS tasks_dedupe ON tasks(dedupe_key, status);
+                    CREATE INDEX IF NOT EXISTS tasks_updated ON tasks(updated);
+                """)
+            finally:
+                conn.close()
+            self.ready = True
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    @contextmanager
+    def _transaction(self):
+        # Connexion courte par opération ; BEGIN IMMEDIATE sérialise les écritures entre process
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("BEGIN IMMEDIATE")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def create_task(self, task_id, status_data, dedupe_key=None):
+        """
+        Crée une tâche, sauf si une tâche active porte déjà la même dedupe_key.
+
+        Returns:
+            tuple: (ID de la tâche créée ou existante, True si créée)
+        """
+        now = time.time()
+        with self.lock, self._transaction() as conn:
+            if dedupe_key:
+                row = conn.execute(
+                    f"SELECT task_id FROM tasks WHERE dedupe_key = ? AND updated > ? "
+                    f"AND status IN ({','.join('?' * len(ACTIVE_STATUSES))}) ORDER BY created DESC LIMIT 1",
+                    (dedupe_key, now - STALE_AFTER, *ACTIVE_STATUSES)
+                ).fetchone()
+                if row is not None:
+                    return row[0], False
+            conn.execute(
+                "INSERT OR REPLACE INTO tasks (task_id, status, dedupe_key, data, created, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (task_id, status_data.get('status'), dedupe_key, json.dumps(status_data), now, now)
+            )
+        return task_id, True
+
+    def update_task_status(self, task_id, status_data):
+        now = time.time()
+        with self.lock, self._transaction() as conn:
+            row = conn.execute("SELECT data FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+            if row is None:
+                data = dict(status_data)
+                conn.execute(
+                    "INSERT INTO tasks (task_id, status, data, created, updated) VALUES (?, ?, ?, ?, ?)",
+                    (task_id, data.get('status'), json.dumps(data), now, now)
+                )
+            else:
+                data = json.loads(row[0])
+                data.update(status_data)
+                conn.execute(
+                    "UPDATE tasks SET status = ?, data = ?, updated = ? WHERE task_id = ?",
+                    (data.get('status'), json.dumps(data), now, task_id)
+                )
+        with self.changed:
+            self.changed.notify_all()
+        if now - self.last_cleanup > CLEANUP_INTERVAL:
+            self.cleanup()
+
+    def get_task_status(self, task_id):
+        if time.time() - self.last_cleanup > CLEANUP_INTERVAL:
+            self.cleanup()
+        return self._read(task_id)[1]
+
+    def _read(self, task_id):
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT updated, data FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+        finally:
+            conn.close()
+        return (row[0], json.loads(row[1])) if row else (None, {})
+
+    def wait_for_update(self, task_id, since=None, timeout=15.0):
+        """
+        Attend que la tâche soit mise à jour après since.
+
+        Les mises à jour de ce process réveillent l'attente immédiatement ; celles
+        des autres workers sont vues en relisant la base toutes les POLL_INTERVAL secondes.
+
+        Args:
+            task_id (str): ID de la tâche
+            since (float): Date de la dernière version reçue (None = état courant)
+            timeout (float): Durée maximale d'attente, en secondes
+
+        Returns:
+            tuple: (date de mise à jour, statut), ou (None, None) si rien n'a changé
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            updated, data = self._read(task_id)
+            if updated is None or since is None or updated > since:
+                return updated, data
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None, None
+            with self.changed:
+                self.changed.wait(min(remaining, POLL_INTERVAL))
+
+    def keep_alive(self, task_id):
+        """
+        Signale une tâche en file d'attente dans ce process.
+
+        Une tâche en attente ne reçoit aucune mise à jour : son updated est
+        rafraîchi toutes les HEARTBEAT_INTERVAL secondes pour qu'elle ne soit ni
+        marquée interrompue ni ignorée par la déduplication. Si le process
+        s'arrête, le rafraîchissement cesse et le nettoyage la passe en erreur.
+        """
+        with self.waiting_lock:
+            self.waiting.add(task_id)
+            if self.heartbeat is None:
+                self.heartbeat = threading.Thread(target=self._heartbeat, daemon=True)
+                self.heartbeat.start()
+
+    def release(self, task_id):
+        """La tâche a quitté la file d'attente (démarrée ou abandonnée)"""
+        with self.waiting_lock:
+            self.waiting.discard(task_id)
+
+    def _heartbeat(self):
+        while True:
+            time.sleep(HEARTBEAT_INTERVAL)
+            with self.waiting_lock:
+                task_ids = list(self.waiting)
+                if not task_ids:
+                    self.heartbeat = None
+                    return
+            now = time.time()
+            with self.lock, self._transaction() as conn:
+                conn.executemany("UPDATE tasks SET updated = ? WHERE task_id = ? AND status = 'queued'",
+                                 [(now, task_id) for task_id in task_ids])
+
+    def cleanup(self):
+        """Supprime les tâches expirées et marque en erreur les tâches actives abandonnées"""
+        now = time.time()
+        self.last_cleanup = now
+        with self.lock, self._transaction() as conn:
+            expired = conn.execute("DELETE FROM tasks WHERE updated < ?", (now - self.ttl,)).rowcount
+            stale = conn.execute(
+                f"SELECT task_id, data FROM tasks WHERE updated < ? "
+                f"AND status IN ({','.join('?' * len(ACTIVE_STATUSES))})",
+                (now - STALE_AFTER, *ACTIVE_STATUSES)
+            ).fetchall()
+            for task_id, data in stale:
+                data = json.loads(data)
+                data.update({'status': 'error', 'error': 'Tâche interrompue'})
+                conn.execute("UPDATE tasks SET status = 'error', data = ? WHERE task_id = ?",
+                             (json.dumps(data), task_id))
+        if expired or stale:
+            logging.info(f"Nettoyage des tâches: {expired} expirées, {len(stale)} interrompues")
+
+
+class JobExecutor:
+    def __init__(self, task_manager, max_workers=2, max_queue=20):
+        """
+        Exécute les jobs longs (téléchargement, transcription) sur un pool borné.
+
+        Args:
+            task_manager (TaskManager): Stockage du statut des jobs
+            max_workers (int): Nombre de jobs exécutés simultanément
+            max_queue (int): Nombre de jobs en attente au-delà duquel les soumissions sont refusées
+        """
+        self.task_manager = task_manager
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self.lock = threading.Lock()
+        self.pending = 0  # Jobs en attente ou en cours dans ce process
+
+    def submit(self, task_id, job, dedupe_key=None):
+        """
+        Soumet job(task_id). Un job identique (même dedupe_key) encore actif est réutilisé.
+
+        Returns:
+            tuple: (ID de la tâche à suivre, True si un nouveau job a été créé)
+
+        Raises:
+            QueueFullError: File d'attente pleine
+        """
+        with self.lock:
+            if self.pending >= self.max_workers + self.max_queue:
+                raise QueueFullError("Trop de tâches en cours, réessayez plus tard")
+            task_id, created = self.task_manager.create_task(
+                task_id, {'status': 'queued', 'progress': 0}, dedupe_key
+            )
+            if not created:
+                logging.info(f"Job déjà en cours pour {dedupe_key}: {task_id}")
+                return task_id, False
+            self.pending += 1
+        self.task_manager.keep_alive(task_id)
+        self.executor.submit(self._run, task_id, job)
+        return task_id, True
+
+    def _run(self, task_id, job):
+        self.task_manager.release(task_id)
+        try:
+            job(task_id)
+        except Exception as e:
+            logging.error(f"Erreur du job {task_id}: {str(e)}", exc_info=True)
+            self.task_manager.update_task_status(task_id, {'status': 'error', 'error': str(e)})
+        finally:
+            with self.lock:
+                self.pending -= 1
@@ -0,0 +1,155 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from ingestion import file_hash
+
+MAX_CACHE_BYTES = 512 * 1024 * 1024  # Taille maximale des transcriptions gardées sur disque
+
+_MEDIA_PATTERNS = (
+    ('youtube', re.compile(r"(?:youtube\.com/(?:watch\?(?:.*&)?v=|shorts/|embed/|live/)|youtu\.be/)([\w-]{11})")),
+    ('tiktok', re.compile(r"tiktok\.com/.*?/video/(\d+)")),
+    ('instagram', re.compile(r"instagram\.com/(?:reels?|p|tv)/([\w-]+)")),
+)
+
+
+def media_key(url):
+    """
+    Clé de cache d'un média d'après son URL : 'youtube:ID', 'tiktok:ID' ou 'instagram:SHORTCODE'.
+
+    Returns:
+        str: La clé, ou None si l'URL n'est pas reconnue
+    """
+    for platform, pattern in _MEDIA_PATTERNS:
+        match = pattern.search(url or "")
+        if match:
+            return f"{platform}:{match.group(1)}"
+    return None
+
+
+def audio_key(audio_path):
+    """Clé de cache d'un fichier audio d'après le hash de son contenu"""
+    return f"audio:{file_hash(audio_path)}"
+
+
+class TranscriptionCache:
+    def __init__(self, cache_dir="cache/transcriptions", max_bytes=MAX_CACHE_BYTES):
+        """
+        Cache des transcriptions adressé par contenu.
+
+        Chaque transcription est stockée une fois, sous le hash de son texte, et
+        référencée par plusieurs clés : ID du média source (connu avant tout
+        téléchargement) et hash de l'audio. Un index SQLite garde les tailles et
+        dates d'accès ; au-delà de max_bytes, les transcriptions les moins
+        récemment utilisées sont supprimées.
+
+        Args:
+            cache_dir (str): Dossier des transcriptions et de l'index
+            max_bytes (int): Taille totale maximale des transcriptions
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(cache_dir, 'index.sqlite3')
+        self.lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        with self._transaction() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS transcripts (
+                    file TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    created REAL NOT NULL,
+                    last_access REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS cache_keys (
+                    key TEXT PRIMARY KEY,
+                    file TEXT NOT NULL REFERENCES transcripts(file) ON DELETE CASCADE
+                );
+                CREATE INDEX IF NOT EXISTS transcripts_lru ON transcripts(last_access);
+            """)
+
+    @contextmanager
+    def _transaction(self):
+        # Connexion courte par opération : utilisable depuis n'importe quel thread ou process
+        conn = sqlite3.connect(self.index_path, timeout=30)
+        try:
+            conn.execute("PRAGMA foreign_keys=ON")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, *keys):
+        """
+        Retourne la transcription associée à l'une des clés, ou None.
+        Les autres clés fournies sont rattachées à la transcription trouvée.
+        """
+        keys = [key for key in keys if key]
+        if not keys:
+            return None
+        with self.lock, self._transaction() as conn:
+            row = conn.execute(
+                f"SELECT file FROM cache_keys WHERE key IN ({','.join('?' * len(keys))}) LIMIT 1", keys
+            ).fetchone()
+            if row is None:
+                return None
+            path = os.path.join(self.cache_dir, row[0])
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    transcript = f.read()
+            except FileNotFoundError:
+                logging.warning(f"Transcription en cache introuvable, entrée supprimée: {path}")
+                conn.execute("DELETE FROM transcripts WHERE file = ?", (row[0],))
+                return None
+            conn.execute("UPDATE transcripts SET last_access = ? WHERE file = ?", (time.time(), row[0]))
+            conn.executemany("INSERT OR REPLACE INTO cache_keys (key, file) VALUES (?, ?)",
+                             [(key, row[0]) for key in keys])
+        logging.info(f"Transcription servie depuis le cache ({keys[0]})")
+        return transcript
+
+    def put(self, transcript, *keys):
+        """Enregistre une transcription sous ces clés, puis applique la limite de taille"""
+        keys = [key for key in keys if key]
+        data = transcript.encode('utf-8')
+        filename = f"{hashlib.sha256(data).hexdigest()}.txt"
+        path = os.path.join(self.cache_dir, filename)
+        if not os.path.exists(path):
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        now = time.time()
+        with self.lock, self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO transcripts (file, size, created, last_access) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(file) DO UPDATE SET last_access = excluded.last_access",
+                (filename, len(data), now, now)
+            )
+            conn.executemany("INSERT OR REPLACE INTO cache_keys (key, file) VALUES (?, ?)",
+                             [(key, filename) for key in keys])
+            self._evict(conn)
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM transcripts").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for filename, size in conn.execute(
+                "SELECT file, size FROM transcripts ORDER BY last_access").fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM transcripts WHERE file = ?", (filename,))
+            try:
+                os.remove(os.path.join(self.cache_dir, filename))
+            except FileNotFoundError:
+                pass
+            total -= size
+            logging.info(f"Transcription évincée du cache: {filename}")
+
+    def stats(self):
+        with self._transaction() as conn:
+            count, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM transcripts").fetchone()
+            keys = conn.execute("SELECT COUNT(*) FROM cache_keys").fetchone()[0]
+        return {'transcripts': count, 'bytes': size, 'keys': keys, 'max_bytes': self.max_bytes}
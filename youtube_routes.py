@@ -1,24 +1,23 @@
-from flask import Blueprint, jsonify, request, render_template
+from flask import Blueprint, Response, current_app, stream_with_context, jsonify, request, render_template
 from YoutubeManager import YoutubeManager
+from tasks import TaskManager, JobExecutor, QueueFullError, FINAL_STATUSES
+from transcription_cache import media_key
+from bulk_transcription import BulkTranscriber, MAX_VIDEOS
 import uuid
+import json
+import time
 import os
 
-class TaskManager:
-    def __init__(self):
-        self.tasks = {}
-
-    def update_task_status(self, task_id, status_data):
-        if task_id in self.tasks:
-            self.tasks[task_id].update(status_data)
-        else:
-            self.tasks[task_id] = status_data
-
-    def get_task_status(self, task_id):
-        return self.tasks.get(task_id, {})
+MAX_CONCURRENT_JOBS = 2  # Téléchargements/transcriptions simultanés (yt-dlp, ffmpeg) par process
+MAX_QUEUED_JOBS = 20  # Au-delà, les nouvelles demandes sont refusées
+STREAM_MIN_INTERVAL = 0.25  # Intervalle minimal entre deux événements d'un flux de statut (regroupement)
+STREAM_KEEPALIVE = 15  # Commentaire SSE envoyé après ce délai sans mise à jour
+STREAM_MAX_DURATION = 120  # Durée maximale d'un flux servi par Flask ; le client repasse ensuite en polling
 
 task_manager = TaskManager()
+job_executor = JobExecutor(task_manager, max_workers=MAX_CONCURRENT_JOBS, max_queue=MAX_QUEUED_JOBS)
 youtube_bp = Blueprint('youtube', __name__)
-youtube_manager = YoutubeManager()  # Ne pas passer le task_manager ici
+youtube_manager = YoutubeManager(task_manager=task_manager)
 
 def get_task_manager():
     return task_manager
@@ -45,56 +44,152 @@ def download():
     url = data.get('url')
     api_key = data.get('api_key')
     provider = data.get('provider', 'openai')
+    index_to_rag = bool(data.get('index_to_rag'))
     
     if not url:
         return jsonify({'success': False, 'error': 'URL required'})
         
     if not api_key:
         return jsonify({'success': False, 'error': 'API key required'})
+
+    # Indexeur fourni par l'application (TranscriptIndexer) : la transcription va directement dans le RAG
+    indexer_class = current_app.config.get('TRANSCRIPT_INDEXER') if index_to_rag else None
+    if index_to_rag and indexer_class is None:
+        return jsonify({'success': False, 'error': 'Indexation indisponible'})
     
-    task_id = str(uuid.uuid4())
-    task_manager.update_task_status(task_id, {'status': 'starting', 'progress': 0})
-    
-    def transcribe_task():
+    def transcribe_task(task_id):
+        task_manager.update_task_status(task_id, {'status': 'starting', 'progress': 0})
+        from AudioTranscriberOpenAI import AudioTranscriberOpenAI
+        # Passer la clé API au transcriber
+        transcriber = AudioTranscriberOpenAI(
+            task_manager=task_manager,
+            api_key=api_key,
+            provider=provider
+        )
+        indexer = None
+        on_segment = on_download = None
+        if indexer_class is not None:
+            # Métadonnées issues du téléchargement : pas de seconde requête à YouTube
+            def on_download(info):
+                nonlocal indexer
+                metadata = {name: info.get(name) for name in ('video_id', 'title', 'url')}
+                indexer = indexer_class(media_key(url) or f"url:{info['video_id']}", metadata)
+            def on_segment(text):
+                if indexer is None:
+                    # Transcription en cache, sans téléchargement : déjà indexée, rien à ré-embedder
+                    indexed = indexer_class.indexed_chunks(media_key(url))
+                    if indexed is not None:
+                        task_manager.update_task_status(task_id, {'indexed_chunks': indexed})
+                        return
+                    # Sinon seul l'ID de la vidéo est connu
+                    on_download({'video_id': media_key(url).split(':', 1)[1], 'url': url})
+                task_manager.update_task_status(task_id, {'indexed_chunks': indexer.add_segment(text)})
         try:
-            from AudioTranscriberOpenAI import AudioTranscriberOpenAI
-            # Passer la clé API au transcriber
-            transcriber = AudioTranscriberOpenAI(
-                task_manager=task_manager,
-                api_key=api_key,
-                provider=provider
-            )
-            transcript = youtube_manager.transcribe_video(url, task_id, transcriber)
-            
-            filename = f"transcript_{task_id}.txt"
-            filepath = os.path.join('static', 'transcripts', filename)
-            os.makedirs(os.path.dirname(filepath), exist_ok=True)
-            
-            with open(filepath, 'w', encoding='utf-8') as f:
-                f.write(transcript)
-                
-            task_manager.update_task_status(task_id, {
-                'status': 'completed',
-                'progress': 100,
-                'transcript': transcript,
-                'download_url': f'/static/transcripts/{filename}'
-            })
-        except Exception as e:
-            task_manager.update_task_status(task_id, {
-                'status': 'error',
-                'error': str(e)
-            })
-    
-    import threading
-    thread = threading.Thread(target=transcribe_task)
-    thread.start()
+            transcript = youtube_manager.transcribe_video(url, task_id, transcriber,
+                                                          on_segment=on_segment, on_download=on_download)
+        except Exception:
+            if indexer is not None:
+                indexer.abort()
+            raise
+        
+        filename = f"transcript_{task_id}.txt"
+        filepath = os.path.join('static', 'transcripts', filename)
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        
+        with open(filepath, 'w', encoding='utf-8') as f:
+            f.write(transcript)
+
+        status = {
+            'status': 'completed',
+            'progress': 100,
+            'transcript': transcript,
+            'download_url': f'/static/transcripts/{filename}'
+        }
+        if indexer is not None:
+            # Indexation finalisée avant le statut final : le client ne suit plus la tâche ensuite
+            status['indexed_chunks'] = indexer.finish()
+            status['index_error'] = indexer.error
+        task_manager.update_task_status(task_id, status)
+
+    # Une même vidéo demandée plusieurs fois pendant son traitement partage la même tâche
+    try:
+        dedupe_key = media_key(url) or url
+        task_id, created = job_executor.submit(str(uuid.uuid4()), transcribe_task,
+                                               dedupe_key=f"{dedupe_key}:rag" if index_to_rag else dedupe_key)
+    except QueueFullError as e:
+        return jsonify({'success': False, 'error': str(e)}), 503
     
     return jsonify({
         'success': True,
-        'task_id': task_id
+        'task_id': task_id,
+        'deduplicated': not created
+    })
+
+@youtube_bp.route('/bulk', methods=['POST'])
+def bulk():
+    """Transcrit toutes les vidéos d'une playlist ou d'une chaîne"""
+    data = request.json
+    url = data.get('url')
+    api_key = data.get('api_key')
+    provider = data.get('provider', 'openai')
+    limit = data.get('limit') or MAX_VIDEOS
+    index_to_rag = bool(data.get('index_to_rag'))
+
+    if not url:
+        return jsonify({'success': False, 'error': 'URL required'})
+
+    if not api_key:
+        return jsonify({'success': False, 'error': 'API key required'})
+
+    indexer_class = current_app.config.get('TRANSCRIPT_INDEXER') if index_to_rag else None
+    if index_to_rag and indexer_class is None:
+        return jsonify({'success': False, 'error': 'Indexation indisponible'})
+
+    def bulk_task(task_id):
+        from AudioTranscriberOpenAI import AudioTranscriberOpenAI
+        transcriber = AudioTranscriberOpenAI(api_key=api_key, provider=provider)
+        output_dir = os.path.join('static', 'transcripts', f"bulk_{task_id}")
+        BulkTranscriber(youtube_manager, transcriber, task_manager, output_dir,
+                        indexer_class=indexer_class).run(task_id, url, limit)
+
+    try:
+        task_id, created = job_executor.submit(str(uuid.uuid4()), bulk_task, dedupe_key=f"bulk:{url}")
+    except QueueFullError as e:
+        return jsonify({'success': False, 'error': str(e)}), 503
+
+    return jsonify({
+        'success': True,
+        'task_id': task_id,
+        'deduplicated': not created
     })
 
 @youtube_bp.route('/status/<task_id>')
 def status(task_id):
     task_status = task_manager.get_task_status(task_id)
     return jsonify(task_status)
+
+@youtube_bp.route('/status/<task_id>/stream')
+def status_stream(task_id):
+    """
+    Flux SSE du statut d'une tâche, jusqu'à sa fin.
+
+    Servi nativement par asgi.py sans retenir de worker ; cette version Flask (serveur WSGI,
+    python app.py) retient un worker et s'arrête donc après STREAM_MAX_DURATION.
+    """
+    def generate():
+        last_update = None
+        deadline = time.monotonic() + STREAM_MAX_DURATION
+        while time.monotonic() < deadline:
+            updated, task_status = task_manager.wait_for_update(task_id, last_update, STREAM_KEEPALIVE)
+            if updated is None and task_status is None:
+                yield ": keepalive\n\n"
+                continue
+            # Seul le dernier état est envoyé : les mises à jour rapprochées sont regroupées
+            yield f"data: {json.dumps(task_status)}\n\n"
+            if updated is None or task_status.get('status') in FINAL_STATUSES:
+                break
+            last_update = updated
+            time.sleep(STREAM_MIN_INTERVAL)
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
@@ -0,0 +1,206 @@
+import time
+import queue
+import logging
+import threading
+from collections import OrderedDict
+from urllib.parse import quote_plus
+from yt_dlp import YoutubeDL
+
+SEARCH_BACKEND = "ytdlp"  # ytdlp (sans navigateur) ou browser (Chrome headless)
+BROWSER_FALLBACK = False  # Si True, repli sur le pool de navigateurs quand yt-dlp échoue
+SEARCH_CACHE_SIZE = 256
+SEARCH_CACHE_TTL = 3600  # En secondes
+MAX_CONCURRENT_SEARCHES = 4  # Recherches exécutées simultanément ; les suivantes attendent
+SEARCH_WAIT_TIMEOUT = 30  # Attente maximale d'une place, en secondes
+BROWSER_POOL_SIZE = 2  # Navigateurs gardés ouverts pour le repli
+MAX_SEARCH_RESULTS = 50
+
+
+class SearchCache:
+    def __init__(self, max_entries=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL):
+        """
+        Cache LRU des résultats de recherche, indexé par (requête normalisée, langue, limite).
+
+        Args:
+            max_entries (int): Nombre maximal de recherches gardées
+            ttl (float): Durée de validité d'une entrée en secondes
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(query, lang, limit):
+        return (" ".join(query.casefold().split()), lang, limit)
+
+    def get(self, query, lang, limit):
+        key = self.key(query, lang, limit)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.time() - entry[1] <= self.ttl:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return list(entry[0])
+            self.entries.pop(key, None)
+            self.misses += 1
+            return None
+
+    def set(self, query, lang, limit, results):
+        key = self.key(query, lang, limit)
+        with self.lock:
+            self.entries[key] = (list(results), time.time())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'hits': self.hits, 'misses': self.misses}
+
+
+def search_ytdlp(query, lang, limit):
+    """
+    Recherche via l'extracteur ytsearchN: de yt-dlp, en extraction à plat :
+    une seule requête HTTP, sans navigateur ni chargement des pages vidéo.
+
+    Returns:
+        list: Tuples (titre, url)
+    """
+    options = {
+        'quiet': True,
+        'no_warnings': True,
+        'extract_flat': True,
+        'skip_download': True,
+        # yt-dlp ne transmet pas le paramètre gl : la région passe par une IP X-Forwarded-For du pays
+        'geo_bypass_country': lang
+    }
+    with YoutubeDL(options) as ydl:
+        info = ydl.extract_info(f"ytsearch{limit}:{query}", download=False)
+    results = []
+    for entry in info.get('entries') or []:
+        video_id = entry.get('id')
+        if entry.get('title') and video_id:
+            results.append((entry['title'], f"https://www.youtube.com/watch?v={video_id}"))
+    return results
+
+
+class BrowserPool:
+    def __init__(self, size=BROWSER_POOL_SIZE):
+        """
+        Pool de navigateurs Chrome headless gardés ouverts entre les recherches.
+
+        Les navigateurs sont créés à la demande, jusqu'à size, puis réutilisés :
+        le coût de démarrage de Chrome n'est payé qu'une fois. Un navigateur en
+        erreur est fermé et remplacé.
+
+        Args:
+            size (int): Nombre maximal de navigateurs ouverts
+        """
+        self.size = size
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(size)
+
+    @staticmethod
+    def _create_driver():
+        from selenium import webdriver
+        from selenium.webdriver.chrome.options import Options
+        chrome_options = Options()
+        chrome_options.add_argument("--headless")
+        chrome_options.add_argument("--incognito")
+        chrome_options.add_argument("--disable-extensions")
+        chrome_options.add_argument("--disable-plugins")
+        chrome_options.add_argument("--disable-gpu")
+        chrome_options.add_argument("--blink-settings=imagesEnabled=false")
+        return webdriver.Chrome(options=chrome_options)
+
+    def search(self, query, lang, limit, timeout=10):
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.webdriver.support import expected_conditions as EC
+
+        with self.slots:
+            try:
+                driver = self.idle.get_nowait()
+            except queue.Empty:
+                driver = self._create_driver()
+            try:
+                driver.get(f"https://www.youtube.com/results?search_query={quote_plus(query)}&gl={lang}&hl=en")
+                videos = WebDriverWait(driver, timeout).until(EC.presence_of_all_elements_located(
+                    (By.CSS_SELECTOR, "#video-title")
+                ))
+                results = []
+                for video in videos:
+                    title = video.get_attribute('title')
+                    url = video.get_attribute('href')
+                    if title and url:
+                        results.append((title, url))
+                    if len(results) >= limit:
+                        break
+            except Exception:
+                driver.quit()
+                raise
+            self.idle.put(driver)
+            return results
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().quit()
+            except queue.Empty:
+                return
+
+
+class YoutubeSearch:
+    def __init__(self, backend=SEARCH_BACKEND, browser_fallback=BROWSER_FALLBACK,
+                 max_concurrent=MAX_CONCURRENT_SEARCHES, cache=None):
+        """
+        Recherche de vidéos YouTube, avec cache et nombre de recherches simultanées borné.
+
+        Args:
+            backend (str): 'ytdlp' ou 'browser'
+            browser_fallback (bool): Repli sur le pool de navigateurs si yt-dlp échoue
+            max_concurrent (int): Nombre maximal de recherches simultanées
+            cache (SearchCache): Cache des résultats (par défaut, un cache propre à l'instance)
+        """
+        self.backend = backend
+        self.browser_fallback = browser_fallback
+        self.slots = threading.BoundedSemaphore(max_concurrent)
+        self.cache = cache or SearchCache()
+        self.browser_pool = BrowserPool() if backend == 'browser' or browser_fallback else None
+
+    def search(self, query, lang="US", limit=3):
+        """
+        Returns:
+            list: Tuples (titre, url), au plus limit
+        """
+        limit = max(1, min(int(limit), MAX_SEARCH_RESULTS))
+        results = self.cache.get(query, lang, limit)
+        if results is not None:
+            return results
+
+        if not self.slots.acquire(timeout=SEARCH_WAIT_TIMEOUT):
+            raise RuntimeError("Trop de recherches en cours, réessayez plus tard")
+        try:
+            start = time.time()
+            if self.backend == 'browser':
+                results = self.browser_pool.search(query, lang, limit)
+            else:
+                try:
+                    results = search_ytdlp(query, lang, limit)
+                except Exception as e:
+                    if self.browser_pool is None:
+                        raise
+                    logging.warning(f"Recherche yt-dlp en échec, repli sur le navigateur: {str(e)}")
+                    results = self.browser_pool.search(query, lang, limit)
+            logging.info(f"Recherche '{query}' ({self.backend}): {len(results)} vidéos en {time.time() - start:.2f}s")
+        finally:
+            self.slots.release()
+
+        self.cache.set(query, lang, limit, results)
+        return results
+
+    def stats(self):
+        return {'backend': self.backend, **self.cache.stats()}